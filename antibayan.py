@@ -1,11 +1,27 @@
 # antibayan.py
 import io
 import os
+import math
+import struct
+import threading
 import numpy as np
 from PIL import Image
 import hashlib
 
 # ========== Perceptual Hash (pHash) ==========
+# Формат хеша:
+#   без префикса — v1, полный декод + LANCZOS (всё, что уже лежит в seen.db)
+#   "d2:"        — быстрый: JPEG draft()/reduce() до ресайза, биты отличаются от v1
+# Форматы между собой несравнимы: одна и та же картинка даёт 5–20 бит разницы на JPEG
+# и 70–90 на палитровых PNG/GIF, поэтому hamming_distance для разных форматов — inf.
+FAST_HASH_PREFIX = "d2:"
+
+
+def hash_format(fp: str) -> str:
+    """Префикс формата хеша: "" для v1, FAST_HASH_PREFIX для быстрого."""
+    return fp.split(":", 1)[0] + ":" if ":" in fp else ""
+
+
 def dhash(image, hash_size=16):
     """
     Difference Hash - более устойчив к изменениям чем average hash.
@@ -23,30 +39,59 @@ def dhash(image, hash_size=16):
     return diff.flatten()
 
 
-def quick_fingerprint(img_bytes: bytes) -> str:
+def shrink_for_hash(image, target):
+    """
+    Дёшево уменьшает картинку не меньше чем до target (w, h) и переводит в 'L':
+    для JPEG — draft() (масштабирование прямо в DCT при декоде),
+    для остальных — reduce() усреднением блоков.
+    """
+    if image.format == "JPEG":
+        image.draft('L', target)
+
+    image = image.convert('L')
+
+    factor = min(image.width // target[0], image.height // target[1])
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+
+def dhash_fast(image, hash_size=16):
+    """
+    То же, что dhash, но сначала дёшево уменьшает картинку (см. shrink_for_hash).
+    """
+    image = shrink_for_hash(image, ((hash_size + 1) * 8, hash_size * 8))
+    image = image.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(image)
+    diff = pixels[:, 1:] > pixels[:, :-1]
+    return diff.flatten()
+
+
+def pack_hash(hash_bits) -> str:
+    """Упаковывает булев массив бит в hex (старший бит первым, как int(bitstring, 2))."""
+    return np.packbits(hash_bits).tobytes().hex()
+
+
+def quick_fingerprint(img_bytes: bytes, fast: bool = False) -> str:
     """
     Возвращает perceptual hash изображения.
     Более устойчив к ресайзу, компрессии, легким изменениям.
+    fast=True — быстрый хеш формата "d2:" (см. FAST_HASH_PREFIX).
     """
     if not img_bytes or len(img_bytes) == 0:
         print("[fingerprint] ❌ Пустые байты")
         return None
     
     try:
-        # Открываем изображение
+        # Один проход декода: битый файл упадёт здесь же, verify() не нужен
         img = Image.open(io.BytesIO(img_bytes))
-        img.verify()
         
-        # Открываем заново после verify
-        img = Image.open(io.BytesIO(img_bytes))
-        
-        # Используем difference hash
-        hash_bits = dhash(img, hash_size=16)
-        
-        # Конвертируем в hex
-        bitstring = "".join('1' if bit else '0' for bit in hash_bits)
-        hash_int = int(bitstring, 2)
-        hash_hex = format(hash_int, '064x')  # 256 бит = 64 hex символа
+        if fast:
+            hash_hex = FAST_HASH_PREFIX + pack_hash(dhash_fast(img, hash_size=16))
+        else:
+            img.load()
+            # Используем difference hash, 256 бит = 64 hex символа
+            hash_hex = pack_hash(dhash(img, hash_size=16))
         
         print(f"[fingerprint] ✅ Хеш создан: {hash_hex[:16]}...")
         return hash_hex
@@ -56,6 +101,431 @@ def quick_fingerprint(img_bytes: bytes) -> str:
         return None
 
 
+# ========== Пакетное хеширование ==========
+PHASH_PREFIX = "p1:"
+PHASH_SIZE = 16       # 16x16 низких частот = 256 бит, как у dhash
+PHASH_IMG_SIZE = 64   # картинка перед DCT
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Матрица DCT-II (ортонормированная), X' = C @ X @ C.T."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    c = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    c[0] /= np.sqrt(2.0)
+    return c
+
+
+_DCT = _dct_matrix(PHASH_IMG_SIZE)
+
+
+def _decode_for_batch(item, fast: bool, hash_size: int, with_phash: bool):
+    """
+    Декодирует одну картинку (bytes или путь) и уменьшает её до массивов,
+    из которых считаются хеши. Вызывается из пула потоков: PIL отпускает GIL
+    на декоде и ресайзе.
+    """
+    try:
+        img = Image.open(io.BytesIO(item) if isinstance(item, (bytes, bytearray)) else item)
+        size = (hash_size + 1, hash_size)
+        if fast:
+            img = shrink_for_hash(img, (max(size[0] * 8, PHASH_IMG_SIZE), max(size[1] * 8, PHASH_IMG_SIZE)))
+            pixels = np.asarray(img.resize(size, Image.Resampling.LANCZOS))
+        else:
+            img.load()
+            # Ровно как в dhash(), чтобы хеши совпадали бит в бит
+            pixels = np.asarray(img.resize(size, Image.Resampling.LANCZOS).convert('L'))
+
+        small = None
+        if with_phash:
+            small = np.asarray(
+                img.convert('L').resize((PHASH_IMG_SIZE, PHASH_IMG_SIZE), Image.Resampling.LANCZOS),
+                dtype=np.float32,
+            )
+        return pixels, small
+    except Exception as e:
+        print(f"[fingerprint] ❌ Ошибка: {type(e).__name__}: {e}")
+        return None
+
+
+def _pack_rows(bits: np.ndarray, prefix: str = "") -> list:
+    """(N, ...) булев тензор -> N hex-строк."""
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return [prefix + row.tobytes().hex() for row in packed]
+
+
+def batch_fingerprints(items, fast: bool = False, mirrored: bool = False, phash: bool = False,
+                       workers: int = None, hash_size: int = 16) -> list:
+    """
+    Хеширует сразу много картинок (bytes или пути к файлам).
+    Декод идёт параллельно, уменьшенные картинки складываются в один тензор,
+    и все хеши считаются одной векторной операцией.
+
+    Возвращает список той же длины: dict с ключами "dhash" (как quick_fingerprint
+    с тем же fast), опционально "dhash_mirror" (зеркало по горизонтали) и
+    "phash" (DCT pHash, префикс "p1:"), либо None, если картинку не удалось прочитать.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    workers = workers or min(8, os.cpu_count() or 1)
+    if workers > 1 and len(items) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            decoded = list(pool.map(lambda it: _decode_for_batch(it, fast, hash_size, phash), items))
+    else:
+        decoded = [_decode_for_batch(it, fast, hash_size, phash) for it in items]
+
+    ok = [i for i, d in enumerate(decoded) if d is not None]
+    results = [None] * len(items)
+    if not ok:
+        print(f"[fingerprint] ❌ Пакет: 0 из {len(items)}")
+        return results
+
+    prefix = FAST_HASH_PREFIX if fast else ""
+    pixels = np.stack([decoded[i][0] for i in ok])  # (N, h, w+1)
+
+    hashes = {"dhash": _pack_rows(pixels[:, :, 1:] > pixels[:, :, :-1], prefix)}
+    if mirrored:
+        flipped = pixels[:, :, ::-1]
+        hashes["dhash_mirror"] = _pack_rows(flipped[:, :, 1:] > flipped[:, :, :-1], prefix)
+    if phash:
+        small = np.stack([decoded[i][1] for i in ok])  # (N, 64, 64)
+        coeffs = (_DCT @ small @ _DCT.T)[:, :PHASH_SIZE, :PHASH_SIZE]
+        median = np.median(coeffs.reshape(len(ok), -1), axis=1)
+        hashes["phash"] = _pack_rows(coeffs > median[:, None, None], PHASH_PREFIX)
+
+    for n, i in enumerate(ok):
+        results[i] = {name: values[n] for name, values in hashes.items()}
+
+    print(f"[fingerprint] ✅ Пакет: {len(ok)} из {len(items)} хешей")
+    return results
+
+
+# ========== Индекс хешей в памяти ==========
+HASH_BYTES = 32  # 256 бит
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount_rows(xored: np.ndarray) -> np.ndarray:
+    """Число единичных бит в каждой строке (N, HASH_BYTES) uint8."""
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        words = np.ascontiguousarray(xored).view(np.uint64)
+        return np.bitwise_count(words).sum(axis=1, dtype=np.uint16)
+    return _POPCOUNT[xored].sum(axis=1, dtype=np.uint16)
+
+
+def hash_to_bytes(fp: str) -> bytes:
+    """hex-хеш (с префиксом формата или без) -> 32 байта, как их сравнивает hamming_distance."""
+    hex_part = fp.split(":", 1)[-1] if ":" in fp else fp
+    return bytes.fromhex(hex_part.zfill(HASH_BYTES * 2)[-HASH_BYTES * 2:])
+
+
+# ========== Партиции индекса по метаданным медиа ==========
+# Ключ партиции — корзины (вид, длительность, соотношение сторон, размер), упакованные в int.
+# Поиск смотрит только свою и соседние корзины (±1, размер фото ±2). ANY_PARTITION — хеши без метаданных
+# (всё, что лежало в seen.db до партиций): их видит любой запрос, а запрос без метаданных видит всё.
+ANY_PARTITION = -1
+# Telegram отдаёт GIF как mp4 без звука, а каналы перезаливают один ролик и так, и так
+MEDIA_KIND_GROUPS = {"photo": 0, "video": 1, "gif": 1}
+_BUCKETS = 32
+
+
+def _clamp_bucket(value: int) -> int:
+    return max(0, min(_BUCKETS - 1, value))
+
+
+def size_bucket(width, height):
+    """Грубая корзина размера: log2 длинной стороны (1280 -> 10, 640 -> 9). None, если размер неизвестен."""
+    if not width or not height:
+        return None
+    return int(max(width, height)).bit_length() - 1
+
+
+def media_partition(kind, duration=None, aspect=None, size=None) -> int:
+    """
+    Ключ партиции для хеша. Длительность — log2-корзины секунд, соотношение сторон —
+    четверть октавы (~19%), размер — size_bucket. Если чего-то не хватает — ANY_PARTITION.
+    """
+    group = MEDIA_KIND_GROUPS.get(kind)
+    if group is None or not aspect or size is None:
+        return ANY_PARTITION
+    if group == 0:
+        dur = 0
+    elif duration is None:
+        return ANY_PARTITION
+    else:
+        dur = _clamp_bucket(int(math.log2(max(duration, 0) + 1)))
+    asp = _clamp_bucket(round(4 * math.log2(aspect)) + _BUCKETS // 2)
+    return ((group * _BUCKETS + dur) * _BUCKETS + asp) * _BUCKETS + _clamp_bucket(size)
+
+
+def partition_neighbours(partition: int) -> set:
+    """
+    Партиция и все соседние по каждой корзине (±1), плюс ANY_PARTITION.
+    Для фото окно по размеру ±2: репост, уменьшенный вчетверо (1280 → 320), уходит на две корзины.
+    """
+    if partition == ANY_PARTITION:
+        return {ANY_PARTITION}
+    rest, size = divmod(partition, _BUCKETS)
+    rest, asp = divmod(rest, _BUCKETS)
+    group, dur = divmod(rest, _BUCKETS)
+    dur_window = (0,) if group == 0 else (-1, 0, 1)
+    size_window = (-2, -1, 0, 1, 2) if group == 0 else (-1, 0, 1)
+    result = {ANY_PARTITION}
+    for dd in dur_window:
+        for da in (-1, 0, 1):
+            for ds in size_window:
+                d, a, z = dur + dd, asp + da, size + ds
+                if 0 <= d < _BUCKETS and 0 <= a < _BUCKETS and 0 <= z < _BUCKETS:
+                    result.add(((group * _BUCKETS + d) * _BUCKETS + a) * _BUCKETS + z)
+    return result
+
+
+# Снапшот индекса: плоский файл упакованных хешей + sidecar "<path>.ids" с (rowid, ts, partition).
+# Заголовок 64 байта, дальше хеши по HASH_BYTES подряд — грузится через np.memmap.
+SNAPSHOT_MAGIC = b"ZBSNAP\x00\x00"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct("<8sIIQq")  # magic, version, hash_bytes, count, max_rowid
+SNAPSHOT_HEADER_SIZE = 64
+SNAPSHOT_IDS_DTYPE = np.dtype([("rowid", "<i8"), ("ts", "<i8"), ("partition", "<i8")])
+# Запись снапшота идёт в потоке, а отменённый to_thread не останавливает поток:
+# без замка сохранение при выходе пишет в те же .tmp одновременно с периодическим.
+_SNAPSHOT_WRITE_LOCK = threading.Lock()
+
+
+def write_snapshot(path: str, parts: list) -> int:
+    """
+    Пишет [(hashes, ids, ts, partition), ...] в снапшот атомарно (через .tmp + os.replace).
+    Одновременные записи выполняются по очереди. Возвращает число записанных хешей.
+    """
+    with _SNAPSHOT_WRITE_LOCK:
+        return _write_snapshot(path, parts)
+
+
+def _write_snapshot(path: str, parts: list) -> int:
+    count = sum(len(part[1]) for part in parts)
+    max_rowid = max((int(part[1].max()) for part in parts if len(part[1])), default=0)
+
+    with open(path + ".ids.tmp", "wb") as f:
+        for _, ids, ts, partition in parts:
+            meta = np.empty(len(ids), dtype=SNAPSHOT_IDS_DTYPE)
+            meta["rowid"] = ids
+            meta["ts"] = ts
+            meta["partition"] = partition
+            f.write(meta.tobytes())
+
+    with open(path + ".tmp", "wb") as f:
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, HASH_BYTES, count, max_rowid)
+        f.write(header.ljust(SNAPSHOT_HEADER_SIZE, b"\x00"))
+        for hashes, *_ in parts:
+            f.write(np.ascontiguousarray(hashes).tobytes())
+
+    os.replace(path + ".ids.tmp", path + ".ids")
+    os.replace(path + ".tmp", path)
+    return count
+
+
+class SeenSegment:
+    """
+    Одна партиция одного поколения индекса: хеши за интервал времени с одним ключом метаданных.
+    Новые хеши копятся в списке и склеиваются в массив при первом поиске.
+    """
+
+    def __init__(self, generation: int, partition: int = ANY_PARTITION, hashes=None, ids=None, ts=None):
+        self.generation = generation
+        self.partition = partition
+        # hashes/ids/ts могут быть срезами np.memmap из снапшота — они не копируются
+        self.hashes = hashes if hashes is not None else np.empty((0, HASH_BYTES), dtype=np.uint8)
+        self.ids = ids if ids is not None else np.empty(0, dtype=np.int64)
+        self.ts = ts if ts is not None else np.empty(0, dtype=np.int64)
+        self._pending_hashes = []
+        self._pending_ids = []
+        self._pending_ts = []
+
+    def __len__(self):
+        return len(self.ids) + len(self._pending_ids)
+
+    def add(self, hash_bytes: bytes, rowid: int, ts: int = 0):
+        self._pending_hashes.append(hash_bytes)
+        self._pending_ids.append(rowid)
+        self._pending_ts.append(ts)
+
+    def _consolidate(self):
+        if not self._pending_ids:
+            return
+        fresh = np.frombuffer(b"".join(self._pending_hashes), dtype=np.uint8).reshape(-1, HASH_BYTES)
+        self.hashes = np.concatenate([self.hashes, fresh])
+        self.ids = np.concatenate([self.ids, np.asarray(self._pending_ids, dtype=np.int64)])
+        self.ts = np.concatenate([self.ts, np.asarray(self._pending_ts, dtype=np.int64)])
+        self._pending_hashes, self._pending_ids, self._pending_ts = [], [], []
+
+    def drop_ids_upto(self, rowid: int) -> int:
+        """Выкидывает строки с id <= rowid. Возвращает, сколько выкинуто."""
+        self._consolidate()
+        keep = self.ids > rowid
+        dropped = len(keep) - int(keep.sum())
+        if dropped:
+            self.hashes, self.ids, self.ts = self.hashes[keep], self.ids[keep], self.ts[keep]
+        return dropped
+
+    def nearest(self, query: np.ndarray):
+        """(расстояние, rowid) ближайшего хеша сегмента или None."""
+        self._consolidate()
+        if not len(self.ids):
+            return None
+        dist = popcount_rows(np.bitwise_xor(self.hashes, query))
+        i = int(dist.argmin())
+        return int(dist[i]), int(self.ids[i])
+
+
+class SeenIndex:
+    """
+    Индекс увиденных хешей для поиска по Hamming distance.
+    Хеши лежат упакованными (32 байта) в сегментах-поколениях по generation_seconds:
+    ретеншен выкидывает старые поколения целиком, без перестройки.
+    Внутри поколения хеши разложены по партициям метаданных (media_partition),
+    поиск с партицией трогает только её соседей.
+    """
+
+    def __init__(self, generation_seconds: int = 86400):
+        self.generation_seconds = generation_seconds
+        self.segments = {}  # generation -> {partition: SeenSegment}
+
+    def __len__(self):
+        return sum(self._generation_size(gen) for gen in self.segments)
+
+    def _generation_size(self, gen: int) -> int:
+        return sum(len(seg) for seg in self.segments[gen].values())
+
+    def add(self, fp: str, rowid: int, ts: float, partition: int = ANY_PARTITION):
+        gen = int(ts) // self.generation_seconds
+        by_partition = self.segments.setdefault(gen, {})
+        seg = by_partition.get(partition)
+        if seg is None:
+            seg = by_partition[partition] = SeenSegment(gen, partition)
+        seg.add(hash_to_bytes(fp), rowid, int(ts))
+
+    def search(self, fp: str, threshold: int, partition: int = ANY_PARTITION):
+        """
+        (расстояние, rowid) самого похожего хеша с расстоянием <= threshold или None.
+        С partition смотрит только соседние партиции и хеши без метаданных.
+        """
+        if not fp or not self.segments:
+            return None
+        query = np.frombuffer(hash_to_bytes(fp), dtype=np.uint8)
+        wanted = None if partition == ANY_PARTITION else partition_neighbours(partition)
+        best = None
+        # От новых поколений к старым: репосты чаще свежие
+        for gen in sorted(self.segments, reverse=True):
+            by_partition = self.segments[gen]
+            if wanted is None:
+                candidates = by_partition.values()
+            else:
+                candidates = [by_partition[p] for p in wanted if p in by_partition]
+            for seg in candidates:
+                found = seg.nearest(query)
+                if found and found[0] <= threshold and (best is None or found[0] < best[0]):
+                    best = found
+            if best is not None and best[0] == 0:
+                break
+        return best
+
+    def drop_older_than(self, ts: float) -> int:
+        """Выкидывает поколения, целиком старше ts. Возвращает число удалённых хешей."""
+        dropped = 0
+        for gen in sorted(self.segments):
+            if (gen + 1) * self.generation_seconds > ts:
+                break
+            dropped += self._generation_size(gen)
+            del self.segments[gen]
+        return dropped
+
+    def drop_ids_upto(self, rowid: int) -> int:
+        """
+        Выкидывает хеши с id <= rowid — в пару к DELETE ... WHERE id <= ? в SQLite,
+        построчно, чтобы индекс не расходился с таблицей. Самое новое поколение
+        не трогается никогда: в нём то, что репостят прямо сейчас.
+        """
+        dropped = 0
+        for gen in sorted(self.segments)[:-1]:
+            by_partition = self.segments[gen]
+            for partition, seg in list(by_partition.items()):
+                dropped += seg.drop_ids_upto(rowid)
+                if not len(seg):
+                    del by_partition[partition]
+            if not by_partition:
+                del self.segments[gen]
+        return dropped
+
+    def snapshot_parts(self) -> list:
+        """
+        Неизменяемые массивы всех сегментов [(hashes, ids, ts, partition), ...] по порядку (поколение, партиция).
+        Дальнейшие add() создают новые массивы, так что части можно писать на диск из другого потока.
+        """
+        parts = []
+        for gen in sorted(self.segments):
+            by_partition = self.segments[gen]
+            for partition in sorted(by_partition):
+                seg = by_partition[partition]
+                seg._consolidate()
+                if len(seg):
+                    parts.append((seg.hashes, seg.ids, seg.ts, partition))
+        return parts
+
+    def save_snapshot(self, path: str) -> int:
+        return write_snapshot(path, self.snapshot_parts())
+
+    @classmethod
+    def load_snapshot(cls, path: str, generation_seconds: int = 86400):
+        """
+        Поднимает индекс из снапшота через np.memmap — без чтения хешей в память.
+        Возвращает (index, max_rowid) или (None, 0), если снапшота нет или он битый.
+        """
+        try:
+            with open(path, "rb") as f:
+                header = f.read(SNAPSHOT_HEADER_SIZE)
+            magic, version, hash_bytes, count, max_rowid = SNAPSHOT_HEADER.unpack_from(header)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or hash_bytes != HASH_BYTES:
+                print(f"[snapshot] ❌ {path}: неизвестный формат")
+                return None, 0
+            if os.path.getsize(path) != SNAPSHOT_HEADER_SIZE + count * HASH_BYTES or \
+                    os.path.getsize(path + ".ids") != count * SNAPSHOT_IDS_DTYPE.itemsize:
+                print(f"[snapshot] ❌ {path}: размер не сходится с заголовком")
+                return None, 0
+        except FileNotFoundError:
+            return None, 0
+        except Exception as e:
+            print(f"[snapshot] ❌ Ошибка: {type(e).__name__}: {e}")
+            return None, 0
+
+        index = cls(generation_seconds=generation_seconds)
+        if not count:
+            return index, max_rowid
+
+        hashes = np.memmap(path, dtype=np.uint8, mode="r", offset=SNAPSHOT_HEADER_SIZE, shape=(count, HASH_BYTES))
+        meta = np.memmap(path + ".ids", dtype=SNAPSHOT_IDS_DTYPE, mode="r", shape=(count,))
+
+        gens = meta["ts"] // generation_seconds
+        partitions = meta["partition"]
+        bounds = np.flatnonzero((gens[1:] != gens[:-1]) | (partitions[1:] != partitions[:-1])) + 1
+        starts = np.concatenate([[0], bounds])
+        ends = np.concatenate([bounds, [count]])
+        keys = list(zip(gens[starts].tolist(), partitions[starts].tolist()))
+        if any(b <= a for a, b in zip(keys, keys[1:])):
+            # Снапшот писался с другим размером поколения и не делится срезами
+            print(f"[snapshot] ❌ {path}: сегменты не по порядку, нужен полный rebuild")
+            return None, 0
+
+        for (gen, partition), start, end in zip(keys, starts, ends):
+            index.segments.setdefault(gen, {})[partition] = SeenSegment(
+                gen, partition, hashes=hashes[start:end], ids=meta["rowid"][start:end], ts=meta["ts"][start:end]
+            )
+        return index, max_rowid
+
+
 def extract_video_frame(video_path: str, frame_number: int = 5) -> bytes:
     """
     Извлекает кадр из видео (не первый, а например 5-й).
@@ -105,24 +575,18 @@ def extract_video_frame(video_path: str, frame_number: int = 5) -> bytes:
 
 
 def hamming_distance(hex1, hex2):
-    """Вычисляет Hamming distance между двумя хешами."""
+    """Вычисляет Hamming distance между двумя хешами. Хеши разных форматов не сравниваются (inf)."""
     if not hex1 or not hex2:
         return float('inf')
+    if hash_format(hex1) != hash_format(hex2):
+        return float('inf')
     
     # Убираем префиксы если есть
     hex1 = hex1.split(":", 1)[-1] if ":" in hex1 else hex1
     hex2 = hex2.split(":", 1)[-1] if ":" in hex2 else hex2
     
-    # Приводим к одной длине
-    max_len = max(len(hex1), len(hex2))
-    hex1 = hex1.zfill(max_len)
-    hex2 = hex2.zfill(max_len)
-    
-    # Конвертируем в бинарный вид
-    b1 = bin(int(hex1, 16))[2:].zfill(len(hex1) * 4)
-    b2 = bin(int(hex2, 16))[2:].zfill(len(hex2) * 4)
-    
-    return sum(c1 != c2 for c1, c2 in zip(b1, b2))
+    # XOR + popcount — то же, что побитовое сравнение выровненных строк
+    return (int(hex1, 16) ^ int(hex2, 16)).bit_count()
 
 
 def is_duplicate(fp: str, seen: dict, max_distance: int = 15) -> bool:
@@ -142,7 +606,7 @@ def is_duplicate(fp: str, seen: dict, max_distance: int = 15) -> bool:
     return False
 
 
-def get_media_fingerprint(media_bytes: bytes = None, file_path: str = None, is_video: bool = False) -> str:
+def get_media_fingerprint(media_bytes: bytes = None, file_path: str = None, is_video: bool = False, fast: bool = False) -> str:
     """
     Универсальный вызов для внешнего кода.
     """
@@ -151,9 +615,9 @@ def get_media_fingerprint(media_bytes: bytes = None, file_path: str = None, is_v
         frame_bytes = extract_video_frame(file_path, frame_number=5)
         if not frame_bytes:
             return None
-        return quick_fingerprint(frame_bytes)
+        return quick_fingerprint(frame_bytes, fast=fast)
     elif media_bytes:
-        return quick_fingerprint(media_bytes)
+        return quick_fingerprint(media_bytes, fast=fast)
     else:
         print("[fingerprint] ❌ Нужны либо media_bytes, либо file_path с is_video=True")
         return None
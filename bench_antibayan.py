@@ -0,0 +1,529 @@
+# bench_antibayan.py
+"""
+Бенчмарк движка antibayan на синтетических данных.
+
+Генерирует локально корпус картинок (и видео, если есть ffmpeg) с вариантами
+"репостов": пережатие JPEG, ресайз, водяной знак, кроп. Меряет:
+
+* скорость хеширования (хешей/сек) для quick_fingerprint, dhash и hamming_distance
+* память на один сохранённый хеш (SQLite, python-строка, упакованные байты)
+* латентность поиска похожего хеша при растущем размере базы
+* precision/recall на пороге, который использует is_duplicate / find_seen
+
+Запуск:
+    python bench_antibayan.py
+    python bench_antibayan.py --images 200 --db-sizes 1000,10000,100000 --json bench.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from antibayan import (
+    SeenIndex,
+    media_partition,
+    partition_neighbours,
+    size_bucket,
+    batch_fingerprints,
+    dhash,
+    quick_fingerprint,
+    hamming_distance,
+    get_media_fingerprint,
+)
+
+# Порог, который используют is_duplicate и find_seen
+DEFAULT_THRESHOLD = 15
+
+IMAGE_VARIANTS = ("jpeg_q60", "jpeg_q30", "resize_50", "resize_25", "watermark", "crop_5", "crop_10")
+VIDEO_VARIANTS = ("reencode_crf35", "scale_50", "watermark", "crop_10")
+
+
+# ========== Синтетический корпус ==========
+def make_image(seed: int, size=(1280, 960)) -> Image.Image:
+    """Случайная "фотография": градиент, фигуры и шум. Детерминирована по seed."""
+    rng = np.random.default_rng(seed)
+    w, h = size
+
+    # Плавный фон из двух градиентов
+    x = np.linspace(0, 1, w, dtype=np.float32)
+    y = np.linspace(0, 1, h, dtype=np.float32)[:, None]
+    base = np.empty((h, w, 3), dtype=np.float32)
+    for c in range(3):
+        a, b, phase = rng.uniform(0, 255), rng.uniform(-120, 120), rng.uniform(0, 6.28)
+        base[..., c] = a + b * np.sin(x * rng.uniform(1, 6) + phase) * np.cos(y * rng.uniform(1, 6))
+    img = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB")
+
+    # Крупные фигуры — они и определяют dhash
+    draw = ImageDraw.Draw(img)
+    for _ in range(int(rng.integers(6, 14))):
+        x0, y0 = int(rng.integers(0, w)), int(rng.integers(0, h))
+        x1, y1 = x0 + int(rng.integers(w // 10, w // 2)), y0 + int(rng.integers(h // 10, h // 2))
+        color = tuple(int(v) for v in rng.integers(0, 256, 3))
+        if rng.random() < 0.5:
+            draw.rectangle([x0, y0, x1, y1], fill=color)
+        else:
+            draw.ellipse([x0, y0, x1, y1], fill=color)
+
+    # Мелкий шум как у камеры
+    noise = rng.normal(0, 6, (h, w, 3))
+    arr = np.clip(np.asarray(img, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(arr, "RGB")
+
+
+def to_jpeg(img: Image.Image, quality: int = 90) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def make_variant(img: Image.Image, kind: str) -> bytes:
+    """Вариант "репоста" картинки."""
+    w, h = img.size
+    if kind == "jpeg_q60":
+        return to_jpeg(img, 60)
+    if kind == "jpeg_q30":
+        return to_jpeg(img, 30)
+    if kind == "resize_50":
+        return to_jpeg(img.resize((w // 2, h // 2), Image.Resampling.BILINEAR), 85)
+    if kind == "resize_25":
+        return to_jpeg(img.resize((w // 4, h // 4), Image.Resampling.BILINEAR), 85)
+    if kind == "watermark":
+        marked = img.copy()
+        draw = ImageDraw.Draw(marked)
+        draw.rectangle([w - w // 4, h - h // 10, w - 10, h - 10], fill=(255, 255, 255))
+        draw.text((w - w // 4 + 10, h - h // 10 + 10), "@some_channel", fill=(0, 0, 0))
+        return to_jpeg(marked, 85)
+    if kind == "crop_5":
+        dx, dy = w // 40, h // 40
+        return to_jpeg(img.crop((dx, dy, w - dx, h - dy)), 85)
+    if kind == "crop_10":
+        dx, dy = w // 20, h // 20
+        return to_jpeg(img.crop((dx, dy, w - dx, h - dy)), 85)
+    raise ValueError(f"Неизвестный вариант: {kind}")
+
+
+def build_image_corpus(n: int, seed: int, size=(1280, 960)):
+    """Возвращает (originals, variants): список байтов и {kind: [байты]}."""
+    originals, variants = [], {kind: [] for kind in IMAGE_VARIANTS}
+    for i in range(n):
+        img = make_image(seed + i, size)
+        originals.append(to_jpeg(img, 92))
+        for kind in IMAGE_VARIANTS:
+            variants[kind].append(make_variant(img, kind))
+    return originals, variants
+
+
+def _ffmpeg_encode(frames_dir: str, out_path: str, vf: str = None, crf: int = 23) -> bool:
+    cmd = ["ffmpeg", "-y", "-framerate", "10", "-i", os.path.join(frames_dir, "%03d.png")]
+    if vf:
+        cmd += ["-vf", vf]
+    cmd += ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-crf", str(crf), out_path]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=60)
+    return result.returncode == 0
+
+
+def build_video_corpus(n: int, seed: int, workdir: str, size=(640, 480), frames: int = 12):
+    """
+    Короткие ролики из медленно "плывущей" синтетической картинки.
+    Возвращает (originals, variants) со списками путей к mp4.
+    """
+    originals, variants = [], {kind: [] for kind in VIDEO_VARIANTS}
+    for i in range(n):
+        frames_dir = os.path.join(workdir, f"frames_{i}")
+        os.makedirs(frames_dir, exist_ok=True)
+        big = make_image(seed + 10_000 + i, (size[0] + frames * 4, size[1]))
+        for f in range(frames):
+            big.crop((f * 4, 0, f * 4 + size[0], size[1])).save(os.path.join(frames_dir, f"{f:03d}.png"))
+
+        orig = os.path.join(workdir, f"v{i}.mp4")
+        if not _ffmpeg_encode(frames_dir, orig):
+            print(f"[bench] ❌ ffmpeg не смог собрать видео {i}")
+            continue
+        originals.append(orig)
+
+        filters = {
+            "reencode_crf35": (None, 35),
+            "scale_50": ("scale=iw/2:-2", 23),
+            "watermark": ("drawbox=x=iw*3/4:y=ih*9/10:w=iw/4-10:h=ih/10-10:color=white:t=fill", 23),
+            "crop_10": ("crop=iw*0.9:ih*0.9,scale=trunc(iw/2)*2:trunc(ih/2)*2", 23),
+        }
+        for kind, (vf, crf) in filters.items():
+            out = os.path.join(workdir, f"v{i}_{kind}.mp4")
+            variants[kind].append(out if _ffmpeg_encode(frames_dir, out, vf, crf) else None)
+    return originals, variants
+
+
+# ========== Замеры ==========
+class _Quiet:
+    """Глушит print() внутри antibayan, чтобы не мерить скорость терминала."""
+
+    def __enter__(self):
+        self._stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        return self
+
+    def __exit__(self, *exc):
+        sys.stdout.close()
+        sys.stdout = self._stdout
+
+
+def bench_throughput(originals, repeat: int = 1) -> dict:
+    """Хешей в секунду для quick_fingerprint / dhash и сравнений в секунду для hamming_distance."""
+    res = {}
+
+    with _Quiet():
+        t0 = time.perf_counter()
+        hashes = []
+        for _ in range(repeat):
+            hashes = [quick_fingerprint(b) for b in originals]
+        dt = time.perf_counter() - t0
+    res["quick_fingerprint_per_sec"] = len(originals) * repeat / dt
+
+    with _Quiet():
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            for b in originals:
+                quick_fingerprint(b, fast=True)
+        dt = time.perf_counter() - t0
+    res["quick_fingerprint_fast_per_sec"] = len(originals) * repeat / dt
+
+    with _Quiet():
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            batch_fingerprints(originals, fast=True)
+        dt = time.perf_counter() - t0
+    res["batch_fast_per_sec"] = len(originals) * repeat / dt
+
+    decoded = [Image.open(io.BytesIO(b)).convert("RGB") for b in originals]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for img in decoded:
+            dhash(img, hash_size=16)
+    dt = time.perf_counter() - t0
+    res["dhash_decoded_per_sec"] = len(decoded) * repeat / dt
+
+    hashes = [h for h in hashes if h]
+    pairs = [(hashes[i], hashes[(i * 7 + 1) % len(hashes)]) for i in range(len(hashes))] * 50
+    t0 = time.perf_counter()
+    for a, b in pairs:
+        hamming_distance(a, b)
+    dt = time.perf_counter() - t0
+    res["hamming_per_sec"] = len(pairs) / dt
+    return res
+
+
+SEEN_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS seen_media (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fingerprint TEXT UNIQUE NOT NULL,
+        chat_id INTEGER,
+        msg_id INTEGER,
+        username TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        metadata TEXT
+    )
+"""
+
+
+def random_hashes(n: int, seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    raw = rng.integers(0, 256, size=(n, 32), dtype=np.uint8)
+    return [row.tobytes().hex() for row in raw]
+
+
+def fill_seen_db(path: str, hashes: list):
+    """Заполняет seen_media так же, как это делает store_seen в zabor.py."""
+    conn = sqlite3.connect(path)
+    conn.execute(SEEN_SCHEMA)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprint ON seen_media(fingerprint)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_msg ON seen_media(chat_id, msg_id)")
+    rows = []
+    for i, fp in enumerate(hashes):
+        meta = {"chat_id": -1000000000000 - i % 300, "msg_id": i, "username": f"channel{i % 300}"}
+        rows.append((fp, meta["chat_id"], meta["msg_id"], meta["username"], json.dumps(meta)))
+    conn.executemany(
+        "INSERT OR IGNORE INTO seen_media (fingerprint, chat_id, msg_id, username, metadata) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def scan_similar(path: str, fp: str, threshold: int) -> bool:
+    """Полный перебор seen_media, которым zabor.py искал похожие до SeenIndex — точка отсчёта для бенчмарка."""
+    conn = sqlite3.connect(path)
+    all_hashes = [row[0] for row in conn.execute("SELECT fingerprint FROM seen_media")]
+    conn.close()
+    for old_fp in all_hashes:
+        if hamming_distance(fp, old_fp) <= threshold:
+            return True
+    return False
+
+
+def bench_memory(workdir: str, n: int = 20_000) -> dict:
+    """Сколько байт занимает один хеш в разных представлениях."""
+    hashes = random_hashes(n, seed=1)
+
+    path = os.path.join(workdir, "mem.db")
+    fill_seen_db(path, hashes)
+    sqlite_bytes = os.path.getsize(path) / n
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    as_strings = random_hashes(n, seed=2)
+    str_bytes = (tracemalloc.get_traced_memory()[0] - before) / n
+    tracemalloc.stop()
+    del as_strings
+
+    return {
+        "sqlite_bytes_per_hash": sqlite_bytes,
+        "python_str_bytes_per_hash": str_bytes,
+        "packed_bytes_per_hash": 32,
+    }
+
+
+def bench_query_latency(workdir: str, db_sizes, threshold: int, queries: int = 5) -> list:
+    """Латентность одного поиска похожего хеша при разных размерах seen_media."""
+    results = []
+    for size in db_sizes:
+        path = os.path.join(workdir, f"seen_{size}.db")
+        hashes = random_hashes(size, seed=size)
+        fill_seen_db(path, hashes)
+        probes = random_hashes(queries, seed=size + 1)
+
+        timings = []
+        for fp in probes:
+            t0 = time.perf_counter()
+            scan_similar(path, fp, threshold)
+            timings.append(time.perf_counter() - t0)
+
+        # Индекс в памяти, как его держит zabor.py: поколения по суткам, 30 дней
+        index = SeenIndex(generation_seconds=86400)
+        for i, fp in enumerate(hashes):
+            index.add(fp, i + 1, i * 30 * 86400 // max(size, 1))
+        index.search(probes[0], threshold)  # склейка сегментов
+        index_timings = []
+        for fp in probes:
+            t0 = time.perf_counter()
+            index.search(fp, threshold)
+            index_timings.append(time.perf_counter() - t0)
+
+        # То же с партициями по метаданным: смесь фото и роликов разной длины/формы
+        partitions = [media_partition("photo", None, a, s) for a in (0.56, 0.75, 1.0, 1.33, 1.78) for s in (9, 10, 11)]
+        partitions += [media_partition("video", d, a, 10) for d in (3, 15, 60, 300) for a in (0.56, 1.0, 1.78)]
+        part_index = SeenIndex(generation_seconds=86400)
+        for i, fp in enumerate(hashes):
+            part_index.add(fp, i + 1, i * 30 * 86400 // max(size, 1), partitions[i % len(partitions)])
+        part_index.search(probes[0], threshold, partitions[0])
+        partition_timings = []
+        for i, fp in enumerate(probes):
+            t0 = time.perf_counter()
+            part_index.search(fp, threshold, partitions[i % len(partitions)])
+            partition_timings.append(time.perf_counter() - t0)
+
+        results.append({
+            "db_size": size,
+            "scan_ms_median": float(np.median(timings)) * 1000,
+            "scan_ms_max": max(timings) * 1000,
+            "index_ms_median": float(np.median(index_timings)) * 1000,
+            "partitioned_ms_median": float(np.median(partition_timings)) * 1000,
+        })
+        print(f"[bench] база {size:>8}: {results[-1]['scan_ms_median']:.1f} мс на запрос")
+    return results
+
+
+def _closest(fp: str, pool: list, skip: int = None):
+    best = float("inf")
+    for j, other in enumerate(pool):
+        if j == skip or other is None:
+            continue
+        best = min(best, hamming_distance(fp, other))
+    return best
+
+
+def bench_quality(orig_hashes: list, variant_hashes: dict, threshold: int,
+                  orig_parts: list = None, variant_parts: dict = None) -> dict:
+    """
+    Precision/recall на пороге threshold.
+    Позитивы — варианты исходника, негативы — остальные исходники корпуса.
+    С партициями (orig_parts / variant_parts) считается и recall поиска с партициями:
+    вариант найден, только если его партиция соседняя для партиции исходника.
+    """
+    per_variant, per_variant_partitioned = {}, {}
+    tp = fn = tp_partitioned = 0
+    for kind, hashes in variant_hashes.items():
+        hits = partitioned_hits = total = 0
+        for i, fp in enumerate(hashes):
+            if not fp or not orig_hashes[i]:
+                continue
+            total += 1
+            if hamming_distance(fp, orig_hashes[i]) <= threshold:
+                hits += 1
+                if orig_parts and variant_parts[kind][i] in partition_neighbours(orig_parts[i]):
+                    partitioned_hits += 1
+        tp += hits
+        fn += total - hits
+        tp_partitioned += partitioned_hits
+        per_variant[kind] = hits / total if total else None
+        per_variant_partitioned[kind] = partitioned_hits / total if total else None
+
+    # Ложные срабатывания: варианты, похожие на чужой исходник,
+    # и исходники, похожие друг на друга
+    fp_count = negatives = 0
+    for hashes in variant_hashes.values():
+        for i, fp in enumerate(hashes):
+            if not fp:
+                continue
+            negatives += 1
+            if _closest(fp, orig_hashes, skip=i) <= threshold:
+                fp_count += 1
+    for i, fp in enumerate(orig_hashes):
+        if not fp:
+            continue
+        negatives += 1
+        if _closest(fp, orig_hashes, skip=i) <= threshold:
+            fp_count += 1
+
+    precision = tp / (tp + fp_count) if tp + fp_count else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "threshold": threshold,
+        "precision": precision,
+        "recall": recall,
+        "false_positive_rate": fp_count / negatives if negatives else 0.0,
+        "recall_by_variant": per_variant,
+        **({
+            "partitioned_recall": tp_partitioned / (tp + fn) if tp + fn else 0.0,
+            "partitioned_recall_by_variant": per_variant_partitioned,
+        } if orig_parts else {}),
+    }
+
+
+def _image_partitions(originals, variants):
+    """Партиции картинок, как их считает zabor для фото: по размеру в пикселях."""
+    def partition(blob):
+        w, h = Image.open(io.BytesIO(blob)).size
+        return media_partition("photo", None, w / h, size_bucket(w, h))
+    return [partition(b) for b in originals], {k: [partition(b) for b in v] for k, v in variants.items()}
+
+
+def _hash_images(originals, variants, fast: bool = False):
+    with _Quiet():
+        orig_hashes = [quick_fingerprint(b, fast=fast) for b in originals]
+        variant_hashes = {k: [quick_fingerprint(b, fast=fast) for b in v] for k, v in variants.items()}
+    return orig_hashes, variant_hashes
+
+
+def _hash_videos(originals, variants):
+    with _Quiet():
+        orig_hashes = [get_media_fingerprint(file_path=p, is_video=True) for p in originals]
+        variant_hashes = {
+            k: [get_media_fingerprint(file_path=p, is_video=True) if p else None for p in v]
+            for k, v in variants.items()
+        }
+    return orig_hashes, variant_hashes
+
+
+# ========== CLI ==========
+def _print_report(report: dict):
+    t = report["throughput"]
+    print("\n=== Скорость ===")
+    print(f"quick_fingerprint: {t['quick_fingerprint_per_sec']:.1f} хешей/сек")
+    print(f"quick_fingerprint(fast=True): {t['quick_fingerprint_fast_per_sec']:.1f} хешей/сек")
+    print(f"batch_fingerprints(fast=True): {t['batch_fast_per_sec']:.1f} хешей/сек")
+    print(f"dhash (уже декодировано): {t['dhash_decoded_per_sec']:.1f} хешей/сек")
+    print(f"hamming_distance: {t['hamming_per_sec']:.0f} сравнений/сек")
+
+    m = report["memory"]
+    print("\n=== Память на хеш ===")
+    print(f"SQLite: {m['sqlite_bytes_per_hash']:.0f} байт")
+    print(f"python str: {m['python_str_bytes_per_hash']:.0f} байт")
+    print(f"упакованные биты: {m['packed_bytes_per_hash']} байт")
+
+    print("\n=== Поиск похожего ===")
+    for row in report["query_latency"]:
+        print(
+            f"{row['db_size']:>8} хешей: скан SQLite {row['scan_ms_median']:.1f} мс (макс {row['scan_ms_max']:.1f}), "
+            f"SeenIndex {row['index_ms_median']:.2f} мс, с партициями {row['partitioned_ms_median']:.2f} мс"
+        )
+
+    for name in ("images", "images_fast", "videos"):
+        q = report.get(f"quality_{name}")
+        if not q:
+            continue
+        print(f"\n=== Качество ({name}, порог {q['threshold']}) ===")
+        print(f"precision {q['precision']:.3f}, recall {q['recall']:.3f}, FPR {q['false_positive_rate']:.4f}")
+        if "partitioned_recall" in q:
+            print(f"с партициями: recall {q['partitioned_recall']:.3f}")
+        for kind, r in q["recall_by_variant"].items():
+            line = f"  {kind:<16} recall {r:.3f}" if r is not None else f"  {kind:<16} —"
+            if r is not None and "partitioned_recall" in q:
+                line += f", с партициями {q['partitioned_recall_by_variant'][kind]:.3f}"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк antibayan на синтетическом корпусе")
+    parser.add_argument("--images", type=int, default=60, help="сколько исходных картинок сгенерировать")
+    parser.add_argument("--videos", type=int, default=8, help="сколько исходных видео (нужен ffmpeg)")
+    parser.add_argument("--no-video", action="store_true", help="не генерировать видео")
+    parser.add_argument("--db-sizes", default="1000,10000,50000", help="размеры базы для замера поиска")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix="antibayan_bench_")
+    try:
+        print(f"[bench] Генерация {args.images} картинок × {len(IMAGE_VARIANTS)} вариантов...")
+        originals, variants = build_image_corpus(args.images, args.seed)
+
+        report = {"config": vars(args)}
+        report["throughput"] = bench_throughput(originals)
+        report["memory"] = bench_memory(workdir)
+        db_sizes = [int(s) for s in args.db_sizes.split(",") if s.strip()]
+        report["query_latency"] = bench_query_latency(workdir, db_sizes, args.threshold)
+
+        orig_parts, variant_parts = _image_partitions(originals, variants)
+        orig_hashes, variant_hashes = _hash_images(originals, variants)
+        report["quality_images"] = bench_quality(orig_hashes, variant_hashes, args.threshold, orig_parts, variant_parts)
+        orig_hashes, variant_hashes = _hash_images(originals, variants, fast=True)
+        report["quality_images_fast"] = bench_quality(
+            orig_hashes, variant_hashes, args.threshold, orig_parts, variant_parts
+        )
+
+        if not args.no_video and args.videos > 0:
+            if shutil.which("ffmpeg"):
+                print(f"[bench] Генерация {args.videos} видео × {len(VIDEO_VARIANTS)} вариантов...")
+                v_orig, v_variants = build_video_corpus(args.videos, args.seed, workdir)
+                if v_orig:
+                    orig_hashes, variant_hashes = _hash_videos(v_orig, v_variants)
+                    report["quality_videos"] = bench_quality(orig_hashes, variant_hashes, args.threshold)
+            else:
+                print("[bench] ⚠️ ffmpeg не найден, видео пропускаем")
+
+        _print_report(report)
+
+        if args.json_path:
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\n[bench] Отчёт сохранён в {args.json_path}")
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# jobqueue.py
+"""
+Долговечная очередь постов на SQLite между ingest- и publisher-процессами.
+
+Ключ идемпотентности — (chat_id, msg_id): повторная постановка того же поста
+игнорируется. Publisher берёт задачу в аренду (lease) и подтверждает её ack();
+если процесс упал, аренда истекает и задачу забирает другой publisher.
+
+Разбирает очередь один publisher за раз (аренда drain): так сохраняются порядок
+постов и интервал между отправками в один чат. Остальные publisher — горячий резерв.
+"""
+import json
+import time
+import sqlite3
+
+
+class JobQueue:
+    def __init__(self, path: str, lease_seconds: int = 120, max_attempts: int = 5):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._init()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init(self):
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                msg_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_until REAL,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                done_at TIMESTAMP,
+                UNIQUE(chat_id, msg_id)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, lease_until)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS drain (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                owner TEXT NOT NULL,
+                lease_until REAL NOT NULL
+            )
+        """)
+        conn.close()
+
+    def hold_drain(self, owner: str) -> bool:
+        """
+        Берёт или продлевает право разбирать очередь. False — очередь разбирает
+        другой живой publisher, этот остаётся в резерве до истечения его аренды.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, lease_until FROM drain WHERE id = 1").fetchone()
+            if row is not None and row["owner"] != owner and row["lease_until"] >= now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO drain (id, owner, lease_until) VALUES (1, ?, ?)",
+                (owner, now + self.lease_seconds),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def release_drain(self, owner: str):
+        conn = self._connect()
+        conn.execute("DELETE FROM drain WHERE id = 1 AND owner = ?", (owner,))
+        conn.close()
+
+    def enqueue(self, chat_id: int, msg_id: int, payload: dict) -> bool:
+        """Ставит пост в очередь. False — такой пост уже был поставлен раньше."""
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO jobs (chat_id, msg_id, payload) VALUES (?, ?, ?)",
+            (chat_id, msg_id, json.dumps(payload, ensure_ascii=False)),
+        )
+        conn.close()
+        return cursor.rowcount == 1
+
+    def has_job(self, chat_id: int, msg_id: int) -> bool:
+        conn = self._connect()
+        row = conn.execute("SELECT 1 FROM jobs WHERE chat_id = ? AND msg_id = ?", (chat_id, msg_id)).fetchone()
+        conn.close()
+        return row is not None
+
+    def claim(self, owner: str):
+        """
+        Берёт в аренду самую старую свободную задачу (или задачу с истёкшей арендой).
+        Возвращает dict с полями задачи и распакованным payload или None.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("""
+                SELECT * FROM jobs
+                WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?)
+                ORDER BY id LIMIT 1
+            """, (now,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("""
+                UPDATE jobs SET state = 'leased', lease_owner = ?, lease_until = ?, attempts = attempts + 1
+                WHERE id = ?
+            """, (owner, now + self.lease_seconds, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        job = dict(row)
+        job["attempts"] += 1
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def ack(self, job_id: int, owner: str) -> bool:
+        """Подтверждает публикацию. False — аренду уже перехватил кто-то другой."""
+        conn = self._connect()
+        cursor = conn.execute("""
+            UPDATE jobs SET state = 'done', done_at = CURRENT_TIMESTAMP, lease_owner = NULL, lease_until = NULL
+            WHERE id = ? AND lease_owner = ? AND state = 'leased'
+        """, (job_id, owner))
+        conn.close()
+        return cursor.rowcount == 1
+
+    def extend(self, job_id: int, owner: str) -> bool:
+        """
+        Продлевает аренду задачи и очереди ещё на lease_seconds (heartbeat во время долгой публикации).
+        False — аренда уже истекла и задачу забрал кто-то другой: публиковать нельзя.
+        """
+        until = time.time() + self.lease_seconds
+        conn = self._connect()
+        job = conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND lease_owner = ? AND state = 'leased'",
+            (until, job_id, owner),
+        )
+        drain = conn.execute("UPDATE drain SET lease_until = ? WHERE id = 1 AND owner = ?", (until, owner))
+        conn.close()
+        return job.rowcount == 1 and drain.rowcount == 1
+
+    def update_payload(self, job_id: int, owner: str, payload: dict) -> bool:
+        """Сохраняет прогресс задачи (например, куда пост уже отправлен). False — аренда потеряна."""
+        conn = self._connect()
+        cursor = conn.execute(
+            "UPDATE jobs SET payload = ? WHERE id = ? AND lease_owner = ? AND state = 'leased'",
+            (json.dumps(payload, ensure_ascii=False), job_id, owner),
+        )
+        conn.close()
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, owner: str, error: str, retry_in: float = 30, final: bool = False) -> str:
+        """
+        Возвращает задачу в очередь с задержкой retry_in, а после max_attempts попыток
+        (или сразу при final=True) помечает её 'failed'. Возвращает новое состояние,
+        либо 'lost', если аренда уже у другого владельца и задача не тронута.
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        state = "failed" if final or (row and row["attempts"] >= self.max_attempts) else "leased"
+        # Отложенный повтор — та же аренда, которая истечёт через retry_in
+        cursor = conn.execute("""
+            UPDATE jobs SET state = ?, lease_owner = NULL, lease_until = ?, last_error = ?
+            WHERE id = ? AND lease_owner = ?
+        """, (state, time.time() + retry_in, error[:500], job_id, owner))
+        conn.close()
+        return state if cursor.rowcount == 1 else "lost"
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        rows = conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        conn.close()
+        return {state: count for state, count in rows}
+
+    def purge_done(self, older_than_days: int = 7) -> int:
+        conn = self._connect()
+        cursor = conn.execute(
+            "DELETE FROM jobs WHERE state = 'done' AND done_at < datetime('now', ?)",
+            (f"-{older_than_days} days",),
+        )
+        conn.close()
+        return cursor.rowcount
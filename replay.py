@@ -0,0 +1,549 @@
+# replay.py
+"""
+Офлайн-прогон пайплайна zabor без Telegram.
+
+Подменяет TelegramClient и aiogram Bot in-process фейками с настраиваемой
+задержкой и инъекцией FloodWait, прогоняет синтетический или записанный
+трафик каналов через настоящие poll_monitored_channels / check_channel /
+process_message / callback_like_post и печатает:
+
+* посты в минуту
+* перцентили end-to-end латентности (появление в канале -> публикация в ZABORISTOE)
+* число API-вызовов на один опубликованный пост
+
+Всё время внутри прогона "модельное": sleep() в zabor.py, задержки API и
+моменты появления постов умножаются на --time-scale, а метрики пересчитываются
+обратно в модельные секунды. Так 10 минут трафика прогоняются за секунды.
+
+Запуск:
+    python replay.py --channels 20 --posts 10 --time-scale 0.01
+    python replay.py --traffic recorded.jsonl --flood-rate 0.05
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FAKE_CONFIG = {
+    "API_ID": 1,
+    "API_HASH": "replay",
+    "SESSION_NAME": "replay.session",
+    "BOT_TOKEN": "123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA",
+    "ZABORISTOE": -1001000000001,
+    "IPNTZ": -1001000000002,
+    "DOPAMINE": -1001000000003,
+    "ADMINS_FILE": "admins.txt",
+    "DB_FILE": "db.json",
+    "SEEN_DB_FILE": "seen.db",
+}
+
+
+# ========== Фейковые объекты Telethon ==========
+class FakeChat:
+    def __init__(self, chat_id, username):
+        self.id = chat_id
+        self.username = username
+
+
+class PhotoSize:
+    def __init__(self, type, w, h):
+        self.type = type
+        self.w = w
+        self.h = h
+
+
+class FakePhoto:
+    def __init__(self, w, h):
+        # Как у Telegram: размеры берутся из метаданных, а не из скачанного файла
+        self.sizes = [PhotoSize("y", w, h)]
+
+
+class MessageMediaPhoto:
+    def __init__(self, data: bytes):
+        from PIL import Image
+        self.photo = FakePhoto(*Image.open(io.BytesIO(data)).size)
+        self.data = data
+        self.ext = ".jpg"
+
+
+class DocumentAttributeVideo:
+    def __init__(self, duration=10, w=640, h=480):
+        self.duration = duration
+        self.w = w
+        self.h = h
+
+
+class DocumentAttributeAnimated:
+    pass
+
+
+class FakeDocument:
+    def __init__(self, mime_type, attributes):
+        self.mime_type = mime_type
+        self.attributes = attributes
+
+
+class MessageMediaDocument:
+    def __init__(self, data: bytes, mime_type: str, attributes=None, ext=".bin"):
+        self.document = FakeDocument(mime_type, attributes or [])
+        self.data = data
+        self.ext = ext
+
+
+class FakeMessage:
+    def __init__(self, msg_id, chat, text="", media=None, grouped_id=None, web_preview=None, arrive_at=0.0):
+        self.id = msg_id
+        self.message = text
+        self.media = media
+        self.grouped_id = grouped_id
+        self.web_preview = web_preview
+        self.arrive_at = arrive_at  # модельные секунды от старта прогона
+        self._chat = chat
+
+    async def get_chat(self):
+        return self._chat
+
+
+def _make_flood_wait(seconds: int):
+    from telethon.errors import FloodWaitError
+    return FloodWaitError(request=None, capture=seconds)
+
+
+class FakeTelegramClient:
+    """
+    Подмена TelegramClient: отдаёт посты по мере их "появления" в каналах.
+    Считает вызовы и может кидать FloodWaitError с заданной вероятностью.
+    """
+
+    def __init__(self, clock, channels: dict, latency: float = 0.05, flood_rate: float = 0.0,
+                 flood_seconds: int = 5, rng: random.Random = None):
+        self.clock = clock
+        self.channels = channels  # key -> [FakeMessage], по возрастанию id
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.rng = rng or random.Random(0)
+        self.calls = Counter()
+        self.floods = 0
+
+    async def _api(self, method):
+        self.calls[method] += 1
+        await asyncio.sleep(self.clock.to_wall(self.latency))
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.floods += 1
+            raise _make_flood_wait(self.flood_seconds)
+
+    async def start(self, *args, **kwargs):
+        return self
+
+    def is_connected(self):
+        return True
+
+    def _visible(self, key):
+        now = self.clock.now()
+        return [m for m in self.channels.get(key, []) if m.arrive_at <= now]
+
+    def _find(self, chat_id, msg_id):
+        for key, msgs in self.channels.items():
+            for m in msgs:
+                if m.id == msg_id and m._chat.id == chat_id:
+                    return m
+        return None
+
+    def _key(self, entity):
+        if isinstance(entity, FakeChat):
+            return next((k for k, msgs in self.channels.items() if msgs and msgs[0]._chat is entity), None)
+        return entity
+
+    async def get_messages(self, entity, limit=None, ids=None, offset_id=0, **kwargs):
+        await self._api("get_messages")
+        if ids is not None:
+            return self._find(getattr(entity, "id", entity), ids)
+        msgs = sorted(self._visible(self._key(entity)), key=lambda m: m.id, reverse=True)
+        if offset_id:
+            msgs = [m for m in msgs if m.id < offset_id]
+        return msgs[:limit] if limit else msgs
+
+    async def download_media(self, media, file=None, **kwargs):
+        await self._api("download_media")
+        data = getattr(media, "data", None)
+        if data is None:
+            return None
+        if file is bytes:
+            return data
+        path = f"{file}{media.ext}"
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    async def get_chat(self, entity):
+        await self._api("get_chat")
+        msgs = self.channels.get(entity)
+        return msgs[0]._chat if msgs else None
+
+    async def get_entity(self, entity):
+        await self._api("get_entity")
+        msgs = self.channels.get(entity)
+        if not msgs:
+            raise ValueError(f'No user has "{entity}" as username')
+        return msgs[0]._chat
+
+
+# ========== Фейковый aiogram Bot ==========
+class FakeBot:
+    """
+    Подмена aiogram Bot: принимает все send_* и фиксирует публикации.
+    FloodWait имитируется текстом ошибки, который разбирает safe_send.
+    """
+
+    def __init__(self, clock, main_chat_id, latency: float = 0.05, flood_rate: float = 0.0,
+                 flood_seconds: int = 1, rng: random.Random = None):
+        self.clock = clock
+        self.main_chat_id = main_chat_id
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.rng = rng or random.Random(1)
+        self.calls = Counter()
+        self.floods = 0
+        self.published = []  # (модельное время, chat_id, msg_id)
+        self.sent = []        # (метод, chat_id)
+
+    async def _send(self, method, chat_id, reply_markup=None):
+        self.calls[method] += 1
+        await asyncio.sleep(self.clock.to_wall(self.latency))
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.floods += 1
+            raise Exception(f"Telegram server says - Too Many Requests: retry after {self.flood_seconds}")
+        self.sent.append((method, chat_id))
+        if chat_id == self.main_chat_id and reply_markup is not None:
+            data = reply_markup.inline_keyboard[0][0].callback_data
+            _, msg_id, src_chat = data.split(":")
+            self.published.append((self.clock.now(), int(src_chat), int(msg_id)))
+        return {"chat_id": chat_id}
+
+    async def send_message(self, chat_id, text=None, reply_markup=None, **kwargs):
+        return await self._send("send_message", chat_id, reply_markup)
+
+    async def send_photo(self, chat_id, photo=None, reply_markup=None, **kwargs):
+        return await self._send("send_photo", chat_id, reply_markup)
+
+    async def send_video(self, chat_id, video=None, reply_markup=None, **kwargs):
+        return await self._send("send_video", chat_id, reply_markup)
+
+    async def send_animation(self, chat_id, animation=None, reply_markup=None, **kwargs):
+        return await self._send("send_animation", chat_id, reply_markup)
+
+    async def send_document(self, chat_id, document=None, reply_markup=None, **kwargs):
+        return await self._send("send_document", chat_id, reply_markup)
+
+
+class FakeCallbackMessage:
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def edit_reply_markup(self, reply_markup=None):
+        self.bot.calls["edit_reply_markup"] += 1
+
+
+class FakeCallbackQuery:
+    def __init__(self, bot, data):
+        self.data = data
+        self.message = FakeCallbackMessage(bot)
+        self.bot = bot
+        self.answers = []
+
+    async def answer(self, text=None, **kwargs):
+        self.bot.calls["answer_callback_query"] += 1
+        self.answers.append(text)
+
+
+# ========== Модельное время ==========
+class ReplayClock:
+    """Переводит модельные секунды в реальные и обратно."""
+
+    def __init__(self, scale: float):
+        self.scale = scale
+        self.t0 = time.perf_counter()
+
+    def now(self) -> float:
+        return (time.perf_counter() - self.t0) / self.scale
+
+    def to_wall(self, seconds: float) -> float:
+        return seconds * self.scale
+
+
+class _ScaledAsyncio:
+    """Подменяет модуль asyncio внутри zabor.py: все sleep() идут в модельном времени."""
+
+    def __init__(self, clock):
+        self._clock = clock
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    async def sleep(self, delay, result=None):
+        return await asyncio.sleep(self._clock.to_wall(delay), result)
+
+
+# ========== Трафик ==========
+def synthetic_traffic(channels: int, posts: int, duration: float, seed: int,
+                      dup_rate: float = 0.2, text_rate: float = 0.2, ignored_rate: float = 0.05):
+    """
+    Генерирует трафик: фото, текст, стоп-слова и кросспосты (одна картинка
+    в нескольких каналах, пережатая). Возвращает {key: [FakeMessage]}.
+    """
+    from bench_antibayan import make_image, to_jpeg, make_variant
+
+    rng = random.Random(seed)
+    pool = []  # картинки, которые можно "перепостить"
+    traffic = {}
+    for c in range(channels):
+        key = f"@replay_channel_{c}"
+        chat = FakeChat(-1002000000000 - c, key.lstrip("@"))
+        arrivals = sorted(rng.uniform(0, duration) for _ in range(posts))
+        msgs = []
+        for i, t in enumerate(arrivals, start=1):
+            roll = rng.random()
+            if roll < ignored_rate:
+                msg = FakeMessage(i, chat, text="подпишись на канал", arrive_at=t)
+            elif roll < ignored_rate + text_rate:
+                msg = FakeMessage(i, chat, text=f"шутка #{c}-{i}", arrive_at=t)
+            elif pool and roll < ignored_rate + text_rate + dup_rate:
+                img = rng.choice(pool)
+                data = make_variant(img, rng.choice(("jpeg_q60", "resize_50", "watermark")))
+                msg = FakeMessage(i, chat, media=MessageMediaPhoto(data), arrive_at=t)
+            else:
+                img = make_image(seed * 100_000 + c * 1000 + i, (640, 480))
+                pool.append(img)
+                msg = FakeMessage(i, chat, media=MessageMediaPhoto(to_jpeg(img, 90)), arrive_at=t)
+            msgs.append(msg)
+        traffic[key] = msgs
+    return traffic
+
+
+def load_traffic(path: str):
+    """
+    Записанный трафик: JSONL со строками вида
+    {"channel": "@name", "chat_id": -100..., "id": 17, "t": 12.5, "text": "...",
+     "kind": "photo|video|gif|document|text", "file": "path/to/media", "grouped_id": null}
+    Для video/gif можно указать "duration", "w", "h" (как в DocumentAttributeVideo).
+    """
+    traffic, chats = {}, {}
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            key = rec["channel"]
+            if key not in chats:
+                chat_id = rec.get("chat_id") or -1003000000000 - len(chats)
+                chats[key] = FakeChat(chat_id, key.lstrip("@") if key.startswith("@") else None)
+
+            media = None
+            kind = rec.get("kind", "text")
+            if kind != "text" and rec.get("file"):
+                file_path = rec["file"] if os.path.isabs(rec["file"]) else os.path.join(base, rec["file"])
+                with open(file_path, "rb") as mf:
+                    data = mf.read()
+                ext = os.path.splitext(file_path)[1] or ".bin"
+                if kind == "photo":
+                    media = MessageMediaPhoto(data)
+                elif kind in ("video", "gif"):
+                    video_attr = DocumentAttributeVideo(rec.get("duration", 10), rec.get("w", 640), rec.get("h", 480))
+                    attributes = [video_attr] if kind == "video" else [DocumentAttributeAnimated(), video_attr]
+                    media = MessageMediaDocument(data, "video/mp4", attributes, ext)
+                else:
+                    media = MessageMediaDocument(data, rec.get("mime_type", "application/octet-stream"), [], ext)
+
+            traffic.setdefault(key, []).append(FakeMessage(
+                rec["id"], chats[key], text=rec.get("text", ""), media=media,
+                grouped_id=rec.get("grouped_id"), arrive_at=float(rec.get("t", 0.0)),
+            ))
+    for msgs in traffic.values():
+        msgs.sort(key=lambda m: m.id)
+    return traffic
+
+
+# ========== Прогон ==========
+def _import_zabor(workdir: str):
+    """Импортирует zabor.py внутри временного каталога с фейковым конфигом."""
+    with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(FAKE_CONFIG, f)
+    open(os.path.join(workdir, "admins.txt"), "w").close()
+    shutil.copy(os.path.join(REPO_DIR, "ignored.txt"), os.path.join(workdir, "ignored.txt"))
+    os.chdir(workdir)
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    import zabor
+    return zabor
+
+
+def _percentiles(values, ps=(50, 90, 99)):
+    if not values:
+        return {f"p{p}": None for p in ps}
+    return {f"p{p}": float(np.percentile(values, p)) for p in ps}
+
+
+async def run_replay(zabor, traffic: dict, clock: ReplayClock, args) -> dict:
+    rng = random.Random(args.seed)
+    fake_clients = [
+        FakeTelegramClient(clock, traffic, latency=args.client_latency, flood_rate=args.flood_rate,
+                           flood_seconds=args.flood_seconds, rng=random.Random(args.seed + 10 + i))
+        for i in range(args.sessions)
+    ]
+    fake_bot = FakeBot(clock, zabor.ZABORISTOE, latency=args.bot_latency,
+                       flood_rate=args.bot_flood_rate, flood_seconds=1, rng=random.Random(args.seed + 1))
+
+    zabor.SHARDS = [
+        zabor.UserbotShard(f"replay_{i}.session", fc, args.session_rate) for i, fc in enumerate(fake_clients)
+    ]
+    for shard in zabor.SHARDS:
+        shard.clock = clock.now
+        shard.updated = clock.now()
+    zabor.SHARD_RING = zabor.ShardRing(zabor.SHARDS)
+    zabor.client = fake_clients[0]
+    zabor.bot = fake_bot
+    zabor.asyncio = _ScaledAsyncio(clock)
+
+    for key in traffic:
+        await zabor.add_monitored(key)
+
+    last_arrival = max((m.arrive_at for msgs in traffic.values() for m in msgs), default=0.0)
+    tasks = [asyncio.create_task(zabor.poll_monitored_channels())]
+    if args.queue:
+        # ingest и publisher через очередь, но в одном процессе
+        zabor.RUN_MODE = "ingest"
+        zabor.JOB_QUEUE = zabor.JobQueue(zabor.JOBS_DB_FILE)
+        tasks.append(asyncio.create_task(zabor.publisher_loop("replay-publisher")))
+
+    # Ждём, пока поллер не дочитает все каналы до последнего поста
+    while True:
+        await asyncio.sleep(clock.to_wall(5))
+        done = all(
+            zabor.DB["monitored"][key].get("last_id", 0) >= msgs[-1].id
+            for key, msgs in traffic.items() if msgs
+        )
+        if done and args.queue:
+            stats = zabor.JOB_QUEUE.stats()
+            done = not stats.get("pending") and not stats.get("leased")
+        if done and clock.now() >= last_arrival:
+            break
+        if args.max_time and clock.now() > args.max_time:
+            print("[replay] ⚠️ Превышено --max-time, останавливаемся")
+            break
+    finished_at = clock.now()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Кнопка «Класс!» на части опубликованного
+    likes = 0
+    for _, chat_id, msg_id in list(fake_bot.published):
+        if rng.random() < args.like_rate:
+            await zabor.callback_like_post(FakeCallbackQuery(fake_bot, f"like_post:{msg_id}:{chat_id}"))
+            likes += 1
+
+    arrivals = {(m._chat.id, m.id): m.arrive_at for msgs in traffic.values() for m in msgs}
+    latencies = [t - arrivals[(c, i)] for t, c, i in fake_bot.published if (c, i) in arrivals]
+    published = len(fake_bot.published)
+    total_posts = sum(len(msgs) for msgs in traffic.values())
+    client_calls = Counter()
+    for fc in fake_clients:
+        client_calls.update(fc.calls)
+    api_calls = sum(client_calls.values()) + sum(fake_bot.calls.values())
+
+    return {
+        "posts_in": total_posts,
+        "published": published,
+        "likes": likes,
+        "model_seconds": finished_at,
+        "wall_seconds": finished_at * clock.scale,
+        "posts_per_min": published / (finished_at / 60) if finished_at else 0.0,
+        "latency_sec": _percentiles(latencies),
+        "api_calls_total": api_calls,
+        "api_calls_per_published": api_calls / published if published else None,
+        "client_calls": dict(client_calls),
+        "session_calls": [sum(fc.calls.values()) for fc in fake_clients],
+        "bot_calls": dict(fake_bot.calls),
+        "flood_waits": {"client": sum(fc.floods for fc in fake_clients), "bot": fake_bot.floods},
+    }
+
+
+def _print_report(report: dict):
+    print("\n=== Replay ===")
+    print(f"Постов на входе: {report['posts_in']}, опубликовано: {report['published']}, лайков: {report['likes']}")
+    print(f"Модельное время: {report['model_seconds']:.0f} сек (реально {report['wall_seconds']:.1f} сек)")
+    print(f"Пропускная способность: {report['posts_per_min']:.2f} постов/мин")
+    lat = report["latency_sec"]
+    if lat["p50"] is not None:
+        print(f"Латентность: p50 {lat['p50']:.1f}с, p90 {lat['p90']:.1f}с, p99 {lat['p99']:.1f}с")
+    per_post = report["api_calls_per_published"]
+    print(f"API-вызовов: {report['api_calls_total']}" + (f" ({per_post:.1f} на пост)" if per_post else ""))
+    print(f"  client: {report['client_calls']}")
+    if len(report["session_calls"]) > 1:
+        print(f"  по сессиям: {report['session_calls']}")
+    print(f"  bot: {report['bot_calls']}")
+    print(f"FloodWait: client {report['flood_waits']['client']}, bot {report['flood_waits']['bot']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-прогон zabor на фейковом Telegram")
+    parser.add_argument("--traffic", help="JSONL с записанным трафиком (иначе синтетика)")
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--posts", type=int, default=10, help="постов на канал")
+    parser.add_argument("--duration", type=float, default=600, help="за сколько модельных секунд приходит трафик")
+    parser.add_argument("--dup-rate", type=float, default=0.2, help="доля кросспостов уже виденных картинок")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="реальных секунд на модельную")
+    parser.add_argument("--sessions", type=int, default=1, help="сколько userbot-сессий (шардов)")
+    parser.add_argument("--session-rate", type=int, default=60, help="бюджет запросов в минуту на сессию")
+    parser.add_argument("--client-latency", type=float, default=0.2, help="задержка Telethon API, сек")
+    parser.add_argument("--bot-latency", type=float, default=0.1, help="задержка Bot API, сек")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="вероятность FloodWait на вызов Telethon")
+    parser.add_argument("--flood-seconds", type=int, default=5)
+    parser.add_argument("--bot-flood-rate", type=float, default=0.0, help="вероятность 429 на вызов Bot API")
+    parser.add_argument("--like-rate", type=float, default=0.1, help="доля опубликованных, на которые жмут «Класс!»")
+    parser.add_argument("--queue", action="store_true", help="ingest -> очередь jobs.db -> publisher вместо прямой публикации")
+    parser.add_argument("--max-time", type=float, default=0, help="ограничение модельного времени, сек")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON")
+    args = parser.parse_args(argv)
+
+    if args.traffic:
+        traffic = load_traffic(args.traffic)
+    else:
+        print(f"[replay] Генерация трафика: {args.channels} каналов × {args.posts} постов")
+        traffic = synthetic_traffic(args.channels, args.posts, args.duration, args.seed, dup_rate=args.dup_rate)
+
+    cwd = os.getcwd()
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    workdir = tempfile.mkdtemp(prefix="zabor_replay_")
+    try:
+        zabor = _import_zabor(workdir)
+        clock = ReplayClock(args.time_scale)
+        report = asyncio.run(run_replay(zabor, traffic, clock, args))
+        _print_report(report)
+        if json_path:
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\n[replay] Отчёт сохранён в {json_path}")
+        return report
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,14 +8,20 @@ import re
 import urllib.parse
 import hashlib
 import sqlite3
+import time
+import bisect
+import sys
+import argparse
 from PIL import Image
 from typing import List, Optional, Iterable
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError, UsernameInvalidError, UsernameNotOccupiedError, ChannelPrivateError
 from aiogram import Bot, Dispatcher, types
 from aiogram.client.default import DefaultBotProperties
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
 from aiogram.filters import Command
-from antibayan import get_media_fingerprint, hamming_distance, extract_video_frame, quick_fingerprint  # Импорт из antibayan
+from jobqueue import JobQueue
+from antibayan import get_media_fingerprint, extract_video_frame, quick_fingerprint, batch_fingerprints, SeenIndex, write_snapshot, media_partition, size_bucket, ANY_PARTITION, hash_format, FAST_HASH_PREFIX  # Импорт из antibayan
 
 
 with open("config.json", "r", encoding="utf-8") as f:
@@ -25,6 +31,10 @@ API_ID = CONFIG["API_ID"]
 API_HASH = CONFIG["API_HASH"]
 SESSION_NAME = CONFIG["SESSION_NAME"]
 
+# Несколько userbot-сессий для чтения каналов: строки или {"name", "api_id", "api_hash", "rate_per_min"}
+SESSIONS = CONFIG.get("SESSIONS") or [SESSION_NAME]
+SESSION_RATE_PER_MIN = CONFIG.get("SESSION_RATE_PER_MIN", 60)  # запросов в минуту на сессию
+
 BOT_TOKEN = CONFIG["BOT_TOKEN"]
 
 ZABORISTOE = CONFIG["ZABORISTOE"]
@@ -34,12 +44,167 @@ DOPAMINE = CONFIG["DOPAMINE"]
 ADMINS_FILE = CONFIG["ADMINS_FILE"]
 DB_FILE = CONFIG["DB_FILE"]
 SEEN_DB_FILE = CONFIG.get("SEEN_DB_FILE", "seen.db")  # SQLite для seen
+FAST_HASH = CONFIG.get("FAST_HASH", False)  # быстрый хеш формата "d2:" (см. antibayan)
+
+BACKFILL_PAGE_SIZE = CONFIG.get("BACKFILL_PAGE_SIZE", 100)
+BACKFILL_PAGE_DELAY = CONFIG.get("BACKFILL_PAGE_DELAY", 5)  # пауза между страницами, сек
+BACKFILL_DOWNLOAD_DELAY = CONFIG.get("BACKFILL_DOWNLOAD_DELAY", 1)  # пауза перед каждой загрузкой медиа, сек
+BACKFILL_RATE_SHARE = CONFIG.get("BACKFILL_RATE_SHARE", 0.25)  # доля бюджета сессии, доступная бэкфиллу
+BACKFILL_MAX_VIDEO_BYTES = CONFIG.get("BACKFILL_MAX_VIDEO_BYTES", 5 * 1024 * 1024)
+
+# Ретеншен seen: 0 — без ограничения
+SEEN_TTL_DAYS = CONFIG.get("SEEN_TTL_DAYS", 0)
+SEEN_MAX_ROWS = CONFIG.get("SEEN_MAX_ROWS", 0)
+SEEN_SEGMENT_HOURS = CONFIG.get("SEEN_SEGMENT_HOURS", 24)  # размер поколения индекса в памяти
+RETENTION_INTERVAL = CONFIG.get("RETENTION_INTERVAL", 3600)  # как часто чистить, сек
+RETENTION_BATCH = 5000        # строк на один DELETE
+RETENTION_VACUUM_PAGES = 2000  # страниц на один incremental_vacuum
+
+# Режим работы: all — всё в одном процессе; ingest — чтение каналов и антибаян с постановкой
+# в очередь; publisher — публикация из очереди; split — ingest + publisher отдельными процессами
+RUN_MODE = CONFIG.get("RUN_MODE", "all")
+JOBS_DB_FILE = CONFIG.get("JOBS_DB_FILE", "jobs.db")
+QUEUE_DIR = CONFIG.get("QUEUE_DIR", "queue")  # медиа постов, ждущих публикации
+PUBLISHER_IDLE_DELAY = 2  # пауза, когда очередь пуста, сек
+JOB_QUEUE = None
+
+IMPORT_CONCURRENCY = CONFIG.get("IMPORT_CONCURRENCY", 8)  # каналов, проверяемых одновременно при импорте
+IMPORT_SESSION_WAIT = CONFIG.get("IMPORT_SESSION_WAIT", 120)  # сколько ждать свободную сессию на канал, сек
+
+SEEN_SNAPSHOT_FILE = CONFIG.get("SEEN_SNAPSHOT_FILE", "seen.snap")  # снапшот индекса для быстрого старта
+SNAPSHOT_INTERVAL = CONFIG.get("SNAPSHOT_INTERVAL", 600)  # как часто писать снапшот, сек
 
 _YT_URL_RE = re.compile(r"(https?://(?:www\.)?(?:youtube\.com|youtu\.be)[^\s\)\]\}]+)", flags=re.IGNORECASE)
 
 
 # ========== Telethon ==========
-client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+class UserbotShard:
+    """
+    Одна userbot-сессия: свой TelegramClient, свой бюджет запросов (token bucket)
+    и отметка, до какого момента сессия в FloodWait.
+    Бэкфилл тратит общий бюджет и вдобавок свой, меньший (BACKFILL_RATE_SHARE),
+    так что опросу всегда остаётся большая часть запросов.
+    """
+
+    def __init__(self, name, client, rate_per_min=SESSION_RATE_PER_MIN):
+        self.name = name
+        self.client = client
+        self.rate_per_min = rate_per_min
+        self.backfill_rate_per_min = max(rate_per_min * BACKFILL_RATE_SHARE, 1)
+        self.clock = time.monotonic
+        self.tokens = float(rate_per_min)
+        self.backfill_tokens = float(self.backfill_rate_per_min)
+        self.updated = self.clock()
+        self.blocked_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.clock() >= self.blocked_until and self.client.is_connected()
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = now - self.updated
+        self.updated = now
+        self.tokens = min(self.rate_per_min, self.tokens + elapsed * self.rate_per_min / 60)
+        self.backfill_tokens = min(
+            self.backfill_rate_per_min, self.backfill_tokens + elapsed * self.backfill_rate_per_min / 60
+        )
+
+    async def acquire(self, backfill: bool = False):
+        """Ждёт, пока в бюджете сессии появится запрос. backfill=True — ещё и в бюджете бэкфилла."""
+        while True:
+            self._refill()
+            if self.tokens >= 1 and (not backfill or self.backfill_tokens >= 1):
+                self.tokens -= 1
+                if backfill:
+                    self.backfill_tokens -= 1
+                return
+            wait = max(1 - self.tokens, 0) * 60 / self.rate_per_min
+            if backfill:
+                wait = max(wait, max(1 - self.backfill_tokens, 0) * 60 / self.backfill_rate_per_min)
+            await asyncio.sleep(wait)
+
+    def penalize(self, seconds):
+        self.blocked_until = self.clock() + seconds
+        print(f"[Shards] {self.name}: FloodWait {seconds} сек, каналы уходят другим сессиям")
+
+
+class ShardRing:
+    """
+    Консистентное хеширование каналов по сессиям.
+    Канал достаётся первой здоровой сессии по кольцу, так что при FloodWait
+    или дисконнекте переезжают только каналы выбывшей сессии.
+    """
+
+    VNODES = 64
+
+    def __init__(self, shards):
+        self.shards = list(shards)
+        self.ring = sorted(
+            (self._hash(f"{shard.name}#{i}"), n)
+            for n, shard in enumerate(self.shards)
+            for i in range(self.VNODES)
+        )
+        self.points = [point for point, _ in self.ring]
+
+    @staticmethod
+    def _hash(value) -> int:
+        return int.from_bytes(hashlib.md5(str(value).encode("utf-8")).digest()[:8], "big")
+
+    def owner(self, key):
+        """Здоровая сессия, отвечающая за канал, или None, если здоровых нет."""
+        if not self.ring:
+            return None
+        start = bisect.bisect(self.points, self._hash(key))
+        tried = set()
+        for i in range(len(self.ring)):
+            n = self.ring[(start + i) % len(self.ring)][1]
+            if n in tried:
+                continue
+            if self.shards[n].healthy:
+                return self.shards[n]
+            tried.add(n)
+            if len(tried) == len(self.shards):
+                break
+        return None
+
+
+def _make_shard(entry) -> UserbotShard:
+    if isinstance(entry, str):
+        entry = {"name": entry}
+    client = TelegramClient(entry["name"], entry.get("api_id", API_ID), entry.get("api_hash", API_HASH))
+    return UserbotShard(entry["name"], client, entry.get("rate_per_min", SESSION_RATE_PER_MIN))
+
+
+SHARDS = [_make_shard(entry) for entry in SESSIONS]
+SHARD_RING = ShardRing(SHARDS)
+
+# Основная сессия: кнопка «Класс!» и всё, что не привязано к каналу
+client = SHARDS[0].client
+
+
+def any_healthy_shard() -> UserbotShard:
+    return next((shard for shard in SHARDS if shard.healthy), SHARDS[0])
+
+
+async def wait_for_shard(key, timeout: float = None):
+    """
+    Здоровая сессия-владелец ключа по кольцу. Если все в FloodWait или без связи — ждёт,
+    но не дольше timeout секунд (None — без ограничения); по таймауту возвращает None.
+    """
+    waited = 0.0
+    while True:
+        shard = SHARD_RING.owner(key)
+        if shard is not None:
+            return shard
+        if timeout is not None and waited >= timeout:
+            return None
+        # Ближайший конец FloodWait; отключённые сессии переподключает recover_shard
+        wait = max(min(s.blocked_until for s in SHARDS) - SHARDS[0].clock(), 1)
+        if timeout is not None:
+            wait = min(wait, timeout - waited)
+        await asyncio.sleep(wait)
+        waited += wait
 
 # ========== Aiogram ==========
 bot = Bot(
@@ -64,6 +229,16 @@ else:
 DB_LOCK = asyncio.Lock()
 
 # ========== SQLite для seen fingerprints ==========
+# created_at хранится как UTC-строка, индексу и роллапам нужен unix time
+SEEN_TS_SQL = "CAST(strftime('%s', created_at) AS INTEGER)"
+
+STATS_COUNTERS = ("seen", "duplicate", "ignored", "published")
+
+# Метаданные медиа рядом с хешем: по ним индекс делится на партиции (см. media_partition)
+SEEN_SHAPE_COLUMNS = (("media_kind", "TEXT"), ("duration", "REAL"), ("aspect", "REAL"), ("size_bucket", "INTEGER"))
+SEEN_SHAPE_SQL = ", ".join(name for name, _ in SEEN_SHAPE_COLUMNS)
+
+
 def init_seen_database():
     """Инициализирует SQLite базу для seen fingerprints"""
     conn = sqlite3.connect(SEEN_DB_FILE, check_same_thread=False)
@@ -78,13 +253,63 @@ def init_seen_database():
             msg_id INTEGER,
             username TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            metadata TEXT
+            metadata TEXT,
+            media_kind TEXT,
+            duration REAL,
+            aspect REAL,
+            size_bucket INTEGER
         )
     """)
+
+    # Старые базы: колонки метаданных добавляются пустыми, такие строки попадают в ANY_PARTITION
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(seen_media)")}
+    for name, sql_type in SEEN_SHAPE_COLUMNS:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE seen_media ADD COLUMN {name} {sql_type}")
     
     # Индексы
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_fingerprint ON seen_media(fingerprint)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_msg ON seen_media(chat_id, msg_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON seen_media(created_at)")
+
+    # Роллапы для /stats: обновляются в тех же транзакциях, что и seen_media
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stats_hourly (
+            hour INTEGER PRIMARY KEY,
+            seen INTEGER NOT NULL DEFAULT 0,
+            duplicate INTEGER NOT NULL DEFAULT 0,
+            ignored INTEGER NOT NULL DEFAULT 0,
+            published INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stats_channel (
+            chat_id INTEGER PRIMARY KEY,
+            username TEXT,
+            seen INTEGER NOT NULL DEFAULT 0,
+            duplicate INTEGER NOT NULL DEFAULT 0,
+            ignored INTEGER NOT NULL DEFAULT 0,
+            published INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stats_total (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            stored INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    if cursor.execute("SELECT 1 FROM stats_total").fetchone() is None:
+        # Первый запуск с роллапами: один раз считаем их по уже накопленной seen_media
+        print("[SQLite] Заполняем роллапы статистики по seen_media...")
+        cursor.execute("INSERT INTO stats_total (id, stored) SELECT 1, COUNT(*) FROM seen_media")
+        cursor.execute(f"""
+            INSERT INTO stats_hourly (hour, seen)
+            SELECT {SEEN_TS_SQL} / 3600 AS h, COUNT(*) FROM seen_media GROUP BY h
+        """)
+        cursor.execute("""
+            INSERT INTO stats_channel (chat_id, username, seen)
+            SELECT chat_id, MAX(username), COUNT(*) FROM seen_media WHERE chat_id IS NOT NULL GROUP BY chat_id
+        """)
     
     conn.commit()
     conn.close()
@@ -93,9 +318,157 @@ def init_seen_database():
 
 init_seen_database()
 
+
+SEEN_HASH_MIXED = False  # в базе остались хеши другого формата (FAST_HASH переключали на живой базе)
+
+
+def resolve_fast_hash(requested: bool) -> bool:
+    """
+    Формат хеша, в котором уже записана seen.db. Форматы несравнимы между собой,
+    так что FAST_HASH действует только на пустой базе, иначе берётся формат базы.
+    """
+    conn = sqlite3.connect(SEEN_DB_FILE)
+    oldest = conn.execute("SELECT fingerprint FROM seen_media ORDER BY id LIMIT 1").fetchone()
+    newest = conn.execute("SELECT fingerprint FROM seen_media ORDER BY id DESC LIMIT 1").fetchone()
+    conn.close()
+    if newest is None:
+        return requested
+    if hash_format(oldest[0]) != hash_format(newest[0]):
+        global SEEN_HASH_MIXED
+        SEEN_HASH_MIXED = True
+        print("[SQLite] ⚠️ В seen.db хеши двух форматов: старые строки другого формата не участвуют в поиске баянов")
+    fast = hash_format(newest[0]) == FAST_HASH_PREFIX
+    if fast != requested:
+        print(f"[SQLite] ⚠️ FAST_HASH={requested}, но seen.db уже в формате {'d2' if fast else 'v1'}: "
+              f"используется формат базы. FAST_HASH переключается только на новой базе")
+    return fast
+
+
+FAST_HASH = resolve_fast_hash(FAST_HASH)
+
 SEEN_DB_LOCK = asyncio.Lock()
 
 
+def _bump_stats(conn, chat_id=None, username=None, **counters):
+    """Прибавляет счётчики к роллапам часа и канала внутри переданной транзакции."""
+    values = [counters.get(name, 0) for name in STATS_COUNTERS]
+    updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in STATS_COUNTERS)
+    conn.execute(f"""
+        INSERT INTO stats_hourly (hour, {", ".join(STATS_COUNTERS)}) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(hour) DO UPDATE SET {updates}
+    """, [int(time.time()) // 3600] + values)
+    if chat_id is not None:
+        conn.execute(f"""
+            INSERT INTO stats_channel (chat_id, username, {", ".join(STATS_COUNTERS)}) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET username = COALESCE(excluded.username, username), {updates}
+        """, [chat_id, username] + values)
+
+
+def record_stats(chat_id=None, username=None, **counters):
+    """Отдельная маленькая транзакция для событий без записи в seen_media (дубли, игнор, публикации)."""
+    try:
+        conn = sqlite3.connect(SEEN_DB_FILE, timeout=30)
+        _bump_stats(conn, chat_id, username, **counters)
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"[stats ERROR] {e}")
+
+
+def media_shape(media, kind: str) -> dict:
+    """
+    Вид, длительность, соотношение сторон и корзина размера медиа — из метаданных Telegram,
+    без скачивания: самый большой размер фото или DocumentAttributeVideo. Чего нет — None.
+    """
+    duration = width = height = None
+    photo = getattr(media, "photo", None)
+    document = getattr(media, "document", None)
+    if photo is not None:
+        sizes = [s for s in getattr(photo, "sizes", []) if getattr(s, "w", None) and getattr(s, "h", None)]
+        if sizes:
+            largest = max(sizes, key=lambda s: s.w * s.h)
+            width, height = largest.w, largest.h
+    elif document is not None:
+        for attr in getattr(document, "attributes", []):
+            if getattr(attr, "w", None) and getattr(attr, "h", None):
+                width, height = attr.w, attr.h
+            if getattr(attr, "duration", None) is not None:
+                duration = float(attr.duration)
+    return {
+        "media_kind": kind,
+        "duration": duration,
+        "aspect": round(width / height, 4) if width and height else None,
+        "size_bucket": size_bucket(width, height),
+    }
+
+
+def seen_partition(meta: dict) -> int:
+    """Партиция индекса для meta с полями media_shape (или ANY_PARTITION без них)."""
+    meta = meta or {}
+    return media_partition(meta.get("media_kind"), meta.get("duration"), meta.get("aspect"), meta.get("size_bucket"))
+
+
+# Индекс хешей в памяти для поиска похожих, строится из SQLite при первом обращении
+SEEN_INDEX = None
+
+
+def get_seen_index() -> SeenIndex:
+    """
+    Индекс поднимается из снапшота (np.memmap, миллисекунды), а из SQLite
+    дочитываются только строки, добавленные после снапшота.
+    Без снапшота — полная сборка из seen_media.
+    """
+    global SEEN_INDEX
+    if SEEN_INDEX is None:
+        generation_seconds = SEEN_SEGMENT_HOURS * 3600
+        conn = sqlite3.connect(SEEN_DB_FILE)
+        db_max_rowid = conn.execute("SELECT COALESCE(MAX(id), 0) FROM seen_media").fetchone()[0]
+
+        # Снапшот не хранит формат хеша: при смешанной базе индекс собирается из SQLite
+        index, since_rowid = (None, 0) if SEEN_HASH_MIXED else SeenIndex.load_snapshot(SEEN_SNAPSHOT_FILE, generation_seconds)
+        if index is not None and since_rowid > db_max_rowid:
+            print("[SQLite] ⚠️ Снапшот новее seen.db, собираем индекс заново")
+            index = None
+        if index is None:
+            index, since_rowid = SeenIndex(generation_seconds=generation_seconds), 0
+        snapshot_size = len(index)
+
+        current_format = FAST_HASH_PREFIX if FAST_HASH else ""
+        for rowid, fp, ts, *shape in conn.execute(
+            f"SELECT id, fingerprint, {SEEN_TS_SQL}, {SEEN_SHAPE_SQL} FROM seen_media WHERE id > ? ORDER BY id",
+            (since_rowid,),
+        ):
+            if hash_format(fp) != current_format:
+                continue
+            index.add(fp, rowid, ts or time.time(), media_partition(*shape))
+        conn.close()
+        SEEN_INDEX = index
+        print(
+            f"[SQLite] Индекс в памяти: {len(index)} хешей ({snapshot_size} из снапшота), "
+            f"{len(index.segments)} поколений"
+        )
+    return SEEN_INDEX
+
+
+async def save_seen_snapshot():
+    """Пишет снапшот индекса; сама запись на диск идёт в отдельном потоке."""
+    if SEEN_INDEX is None:
+        return
+    try:
+        parts = SEEN_INDEX.snapshot_parts()
+        count = await asyncio.to_thread(write_snapshot, SEEN_SNAPSHOT_FILE, parts)
+        print(f"[snapshot] ✅ {count} хешей записано в {SEEN_SNAPSHOT_FILE}")
+    except Exception as e:
+        print(f"[snapshot ERROR] {e}")
+        traceback.print_exc()
+
+
+async def snapshot_loop():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        await save_seen_snapshot()
+
+
 async def store_seen(fp: str, meta: dict):
     """Сохраняет fingerprint в SQLite"""
     async with SEEN_DB_LOCK:
@@ -108,13 +481,19 @@ async def store_seen(fp: str, meta: dict):
             username = meta.get('username')
             metadata_json = json.dumps(meta, ensure_ascii=False)
             
-            cursor.execute("""
+            cursor.execute(f"""
                 INSERT OR IGNORE INTO seen_media 
-                (fingerprint, chat_id, msg_id, username, metadata)
-                VALUES (?, ?, ?, ?, ?)
-            """, (fp, chat_id, msg_id, username, metadata_json))
+                (fingerprint, chat_id, msg_id, username, metadata, {SEEN_SHAPE_SQL})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (fp, chat_id, msg_id, username, metadata_json) + tuple(meta.get(name) for name, _ in SEEN_SHAPE_COLUMNS))
+            inserted = cursor.rowcount == 1
+            if inserted:
+                _bump_stats(conn, chat_id, username, seen=1)
+                cursor.execute("UPDATE stats_total SET stored = stored + 1 WHERE id = 1")
             
             conn.commit()
+            if inserted and SEEN_INDEX is not None:
+                SEEN_INDEX.add(fp, cursor.lastrowid, time.time(), seen_partition(meta))
             conn.close()
             print(f"[store_seen] {fp[:16]}... сохранён в SQLite")
         except Exception as e:
@@ -122,47 +501,77 @@ async def store_seen(fp: str, meta: dict):
             traceback.print_exc()
 
 
-def seen_fingerprint(fp: str) -> bool:
-    """Проверяет точное совпадение fingerprint в SQLite"""
-    try:
-        conn = sqlite3.connect(SEEN_DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT id FROM seen_media WHERE fingerprint = ? LIMIT 1",
-            (fp,)
-        )
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result is not None
-    except Exception as e:
-        print(f"[seen_fingerprint ERROR] {e}")
-        return False
+async def store_seen_bulk(rows: list) -> int:
+    """
+    Сохраняет пачку [(fp, meta), ...] одной транзакцией.
+    Возвращает, сколько строк реально добавлено (дубли игнорируются).
+    """
+    if not rows:
+        return 0
+    async with SEEN_DB_LOCK:
+        try:
+            conn = sqlite3.connect(SEEN_DB_FILE)
+            before = conn.total_changes
+            last_rowid = conn.execute("SELECT COALESCE(MAX(id), 0) FROM seen_media").fetchone()[0]
+            conn.executemany(f"""
+                INSERT OR IGNORE INTO seen_media 
+                (fingerprint, chat_id, msg_id, username, metadata, {SEEN_SHAPE_SQL})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (fp, meta.get('chat_id'), meta.get('msg_id'), meta.get('username'), json.dumps(meta, ensure_ascii=False))
+                + tuple(meta.get(name) for name, _ in SEEN_SHAPE_COLUMNS)
+                for fp, meta in rows
+            ])
+            inserted = conn.total_changes - before
+            # История из бэкфилла — не новые посты, в часовые/канальные счётчики не идёт
+            conn.execute("UPDATE stats_total SET stored = stored + ? WHERE id = 1", (inserted,))
+            conn.commit()
+            if inserted and SEEN_INDEX is not None:
+                for rowid, fp, ts, *shape in conn.execute(
+                    f"SELECT id, fingerprint, {SEEN_TS_SQL}, {SEEN_SHAPE_SQL} FROM seen_media WHERE id > ?",
+                    (last_rowid,),
+                ):
+                    SEEN_INDEX.add(fp, rowid, ts or time.time(), media_partition(*shape))
+            conn.close()
+            print(f"[store_seen] Пачка: {inserted} из {len(rows)} сохранено в SQLite")
+            return inserted
+        except Exception as e:
+            print(f"[store_seen ERROR] {e}")
+            traceback.print_exc()
+            return 0
 
 
-def seen_fingerprint_similar(fp: str, threshold: int = 15) -> bool:
+def find_seen(fp: str, threshold: int = 15, partition: int = ANY_PARTITION) -> Optional[int]:
     """
-    Проверяет, есть ли похожий fingerprint в базе (Hamming <= threshold).
-    Линейный скан — для большой базы добавить ANN (annoy/faiss).
+    id строки seen_media с тем же или похожим хешем, либо None.
+    Похожие ищутся только в соседних партициях (см. seen_partition), точное совпадение — везде.
     """
     try:
         conn = sqlite3.connect(SEEN_DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT fingerprint FROM seen_media")
-        all_hashes = [row[0] for row in cursor.fetchall()]
+        row = conn.execute("SELECT id FROM seen_media WHERE fingerprint = ? LIMIT 1", (fp,)).fetchone()
         conn.close()
-
-        for old_fp in all_hashes:
-            dist = hamming_distance(fp, old_fp)
-            if dist <= threshold:
-                print(f"[bayan] ⚠️ Найден похожий хэш ({old_fp[:16]}...) с расстоянием {dist}")
-                return True
-        return False
+        if row:
+            return row[0]
+        found = get_seen_index().search(fp, threshold, partition)
+        if found:
+            dist, rowid = found
+            print(f"[bayan] ⚠️ Найден похожий хэш (id {rowid}) с расстоянием {dist}")
+            return rowid
+        return None
     except Exception as e:
-        print(f"[seen_fingerprint_similar ERROR] {e}")
-        return False
+        print(f"[find_seen ERROR] {e}")
+        return None
+
+
+def _is_same_post(rowid: int, meta: dict) -> bool:
+    """Хеш в базе записан этим же постом (повторная обработка после рестарта)."""
+    conn = sqlite3.connect(SEEN_DB_FILE)
+    row = conn.execute("SELECT chat_id, msg_id FROM seen_media WHERE id = ?", (rowid,)).fetchone()
+    conn.close()
+    return bool(row and meta and row[0] == meta.get("chat_id") and row[1] == meta.get("msg_id"))
+
+
+BAYAN_LOCK = asyncio.Lock()
 
 
 async def check_and_store_media(media_bytes: bytes = None, file_path: str = None, is_video: bool = False, meta: dict = None) -> bool:
@@ -170,41 +579,186 @@ async def check_and_store_media(media_bytes: bytes = None, file_path: str = None
     Проверяет на баян с использованием antibayan и SQL.
     Возвращает True, если новый.
     """
-    fp = get_media_fingerprint(media_bytes=media_bytes, file_path=file_path, is_video=is_video)
+    fp = get_media_fingerprint(media_bytes=media_bytes, file_path=file_path, is_video=is_video, fast=FAST_HASH)
     if not fp:
         print("[bayan] ❌ Не удалось получить fingerprint")
         return True
 
-    if seen_fingerprint(fp) or seen_fingerprint_similar(fp, threshold=15):
-        print("[bayan] ⚠️ Баян, пропускаем")
-        return False
+    # Сессии опрашивают каналы параллельно: проверка и запись должны быть атомарны,
+    # иначе один и тот же кросспост из двух каналов пройдёт дважды
+    async with BAYAN_LOCK:
+        match = find_seen(fp, threshold=15, partition=seen_partition(meta))
+        if match is not None:
+            # Хеш этого же поста уже мог попасть в базу: из бэкфилла (канал добавлен, но ещё
+            # не опрошен) или в режиме ingest, где пост захешировали, но не успели поставить
+            # в очередь (очередь идемпотентна по (chat_id, msg_id)). Это не баян.
+            if _is_same_post(match, meta):
+                print("[bayan] ↩️ Тот же пост уже захеширован, не баян")
+                return True
+            print("[bayan] ⚠️ Баян, пропускаем")
+            meta = meta or {}
+            record_stats(meta.get("chat_id"), meta.get("username"), duplicate=1)
+            return False
 
-    await store_seen(fp, meta or {})
+        await store_seen(fp, meta or {})
     print(f"[bayan] ✅ Новый контент ({fp[:16]}...)")
     return True
 
 
 def get_seen_stats() -> dict:
-    """Статистика по seen базе"""
+    """
+    Статистика по seen базе из роллапов: O(1) вместо COUNT(*) по seen_media.
+    Окна 24ч/7дн считаются по целым часам.
+    """
     try:
         conn = sqlite3.connect(SEEN_DB_FILE)
         cursor = conn.cursor()
         
-        cursor.execute("SELECT COUNT(*) FROM seen_media")
-        total = cursor.fetchone()[0]
+        total = cursor.execute("SELECT stored FROM stats_total WHERE id = 1").fetchone()
+        now_hour = int(time.time()) // 3600
         
-        cursor.execute("SELECT COUNT(*) FROM seen_media WHERE created_at >= datetime('now', '-1 day')")
-        last_24h = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM seen_media WHERE created_at >= datetime('now', '-7 days')")
-        last_7d = cursor.fetchone()[0]
+        def window(hours):
+            row = cursor.execute(f"""
+                SELECT {", ".join(f"COALESCE(SUM({name}), 0)" for name in STATS_COUNTERS)}
+                FROM stats_hourly WHERE hour > ?
+            """, (now_hour - hours,)).fetchone()
+            return dict(zip(STATS_COUNTERS, row))
         
+        last_24h = window(24)
+        last_7d = window(24 * 7)
         conn.close()
         
-        return {'total': total, 'last_24h': last_24h, 'last_7d': last_7d}
+        return {
+            'total': total[0] if total else 0,
+            'last_24h': last_24h['seen'],
+            'last_7d': last_7d['seen'],
+            'window_24h': last_24h,
+        }
     except Exception as e:
         print(f"[get_seen_stats ERROR] {e}")
-        return {'total': 0, 'last_24h': 0, 'last_7d': 0}
+        return {'total': 0, 'last_24h': 0, 'last_7d': 0, 'window_24h': dict.fromkeys(STATS_COUNTERS, 0)}
+
+
+def get_channel_stats(limit: int = 5) -> list:
+    """Источники с самой высокой долей баянов (среди каналов, где были медиа)."""
+    try:
+        conn = sqlite3.connect(SEEN_DB_FILE)
+        rows = conn.execute("""
+            SELECT chat_id, username, seen, duplicate, ignored, published,
+                   CAST(duplicate AS REAL) / (seen + duplicate) AS dup_rate
+            FROM stats_channel
+            WHERE duplicate > 0
+            ORDER BY dup_rate DESC, duplicate DESC
+            LIMIT ?
+        """, (limit,)).fetchall()
+        conn.close()
+        keys = ("chat_id", "username") + STATS_COUNTERS + ("dup_rate",)
+        return [dict(zip(keys, row)) for row in rows]
+    except Exception as e:
+        print(f"[get_channel_stats ERROR] {e}")
+        return []
+
+# ========== Ретеншен seen ==========
+def _prune_batch(where: str, params: tuple) -> int:
+    """Удаляет одну пачку строк seen_media по условию. Возвращает число удалённых."""
+    conn = sqlite3.connect(SEEN_DB_FILE)
+    cursor = conn.execute(
+        f"DELETE FROM seen_media WHERE id IN (SELECT id FROM seen_media WHERE {where} LIMIT ?)",
+        params + (RETENTION_BATCH,),
+    )
+    deleted = cursor.rowcount
+    conn.execute("UPDATE stats_total SET stored = stored - ? WHERE id = 1", (deleted,))
+    conn.commit()
+    conn.close()
+    return deleted
+
+
+def _enable_incremental_vacuum():
+    """
+    Incremental vacuum, чтобы ретеншен возвращал место на диске кусками.
+    Старую базу нужно один раз перепаковать полным VACUUM — только если ретеншен включён.
+    """
+    conn = sqlite3.connect(SEEN_DB_FILE)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        size_mb = os.path.getsize(SEEN_DB_FILE) / 2**20
+        print(
+            f"[Retention] Включаем auto_vacuum=INCREMENTAL: разовый VACUUM {size_mb:.0f} МБ. "
+            f"Это перезапись всей базы (порядка секунды на 100 МБ, столько же места на диске), "
+            f"запись в seen.db на это время ждёт"
+        )
+        started = time.monotonic()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        print(f"[Retention] ✓ VACUUM за {time.monotonic() - started:.1f} сек")
+    conn.close()
+
+
+def _incremental_vacuum():
+    conn = sqlite3.connect(SEEN_DB_FILE)
+    # Через execute() прагма освобождает одну страницу за вызов, executescript() — все N
+    conn.executescript(f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES});")
+    conn.close()
+
+
+async def prune_seen() -> int:
+    """
+    Применяет SEEN_TTL_DAYS / SEEN_MAX_ROWS к seen_media (пачками, не блокируя цикл надолго)
+    и к индексу в памяти (по TTL — целыми поколениями, по SEEN_MAX_ROWS — по тому же id,
+    что и в SQLite). Возвращает число удалённых строк.
+    """
+    conditions = []
+    cutoff_rowid = None
+    if SEEN_TTL_DAYS:
+        conditions.append(("created_at < datetime('now', ?)", (f"-{SEEN_TTL_DAYS} days",)))
+    if SEEN_MAX_ROWS:
+        conn = sqlite3.connect(SEEN_DB_FILE)
+        row = conn.execute(
+            "SELECT id FROM seen_media ORDER BY id DESC LIMIT 1 OFFSET ?", (SEEN_MAX_ROWS,)
+        ).fetchone()
+        conn.close()
+        if row:
+            cutoff_rowid = row[0]
+            conditions.append(("id <= ?", (cutoff_rowid,)))
+
+    deleted = 0
+    for where, params in conditions:
+        while True:
+            async with SEEN_DB_LOCK:
+                n = await asyncio.to_thread(_prune_batch, where, params)
+            deleted += n
+            if n < RETENTION_BATCH:
+                break
+            await asyncio.sleep(0)
+
+    if deleted:
+        async with SEEN_DB_LOCK:
+            await asyncio.to_thread(_incremental_vacuum)
+
+    dropped = 0
+    if SEEN_INDEX is not None:
+        if SEEN_TTL_DAYS:
+            dropped += SEEN_INDEX.drop_older_than(time.time() - SEEN_TTL_DAYS * 86400)
+        if cutoff_rowid is not None:
+            dropped += SEEN_INDEX.drop_ids_upto(cutoff_rowid)
+
+    if deleted or dropped:
+        print(f"[Retention] Удалено из SQLite: {deleted}, из индекса: {dropped}")
+    return deleted
+
+
+async def retention_loop():
+    if not (SEEN_TTL_DAYS or SEEN_MAX_ROWS):
+        return
+    print(f"[Retention] ✓ TTL {SEEN_TTL_DAYS or '∞'} дн., максимум {SEEN_MAX_ROWS or '∞'} хешей")
+    async with SEEN_DB_LOCK:
+        await asyncio.to_thread(_enable_incremental_vacuum)
+    while True:
+        try:
+            await prune_seen()
+        except Exception as e:
+            print(f"[Retention ERROR] {e}")
+            traceback.print_exc()
+        await asyncio.sleep(RETENTION_INTERVAL)
 
 # ========== Админы ==========
 if os.path.exists(ADMINS_FILE):
@@ -243,6 +797,21 @@ async def remove_monitored(channel):
         print(f"[DB] Канал не найден: {channel}")
         return False
 
+async def add_monitored_bulk(entries: dict) -> list:
+    """
+    Добавляет {канал: {"last_id", "channel_id", "username"}} одной записью db.json.
+    Возвращает каналы, которых ещё не было в списке.
+    """
+    async with DB_LOCK:
+        added = [channel for channel in entries if channel not in DB["monitored"]]
+        for channel in added:
+            DB["monitored"][channel] = entries[channel]
+        if added:
+            with open(DB_FILE, "w", encoding="utf-8") as f:
+                json.dump(DB, f, ensure_ascii=False, indent=2)
+        print(f"[DB] Добавлено каналов: {len(added)} из {len(entries)}")
+        return added
+
 def get_monitored_keys():
     return list(DB["monitored"].keys())
 
@@ -422,23 +991,219 @@ async def safe_send(send_func, *args, max_retries=3, **kwargs):
     raise Exception(f"Не удалось отправить после {max_retries} попыток")
 
 
+# ========== Публикация ==========
+def like_keyboard(chat_id, msg_id):
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="Класс!", callback_data=f"like_post:{msg_id}:{chat_id}")]]
+    )
+
+
+class LeaseLost(Exception):
+    """Аренду задачи перехватил другой publisher — дальше публиковать нельзя."""
+
+
+async def publish_post(post: dict, on_sent=None, before_send=None):
+    """
+    Публикует принятый пост: в ZABORISTOE с подписью и кнопкой, в DOPAMINE без них.
+    post — dict из process_message: chat_id, msg_id, kind, caption, file/links.
+    Каждый чат отправляется отдельно и записывается в post["sent_to"], а on_sent(post)
+    сохраняет прогресс — повтор задачи из очереди не шлёт пост второй раз туда, где он уже есть.
+    before_send() вызывается перед каждой отправкой (publisher проверяет там аренду).
+    """
+    sent_to = post.setdefault("sent_to", [])
+    for target, send in _post_sends(post):
+        if target in sent_to:
+            continue
+        if before_send:
+            await before_send()
+        await send()
+        sent_to.append(target)
+        if target == ZABORISTOE:
+            record_stats(post["chat_id"], post.get("username"), published=1)
+        if on_sent:
+            on_sent(post)
+
+
+def _post_sends(post: dict) -> list:
+    """[(чат, корутина-отправка), ...] по порядку: сначала ZABORISTOE, потом DOPAMINE."""
+    keyboard = like_keyboard(post["chat_id"], post["msg_id"])
+    caption = post.get("caption", "")
+    kind = post["kind"]
+
+    if kind == "youtube":
+        links = list(dict.fromkeys(post["links"]))
+        return [
+            (ZABORISTOE, lambda: post_youtube_links_as_text(bot, ZABORISTOE, links, caption=caption, reply_markup=keyboard)),
+            (DOPAMINE, lambda: _send_to(DOPAMINE, bot.send_message, links[0])),
+        ]
+
+    if kind == "text":
+        return [(ZABORISTOE, lambda: _send_to(ZABORISTOE, bot.send_message, caption, reply_markup=keyboard))]
+
+    path = post["file"]
+    if kind == "video":
+        send, extra = bot.send_video, {"supports_streaming": True}
+    elif kind == "gif":
+        send, extra = bot.send_animation, {}
+    elif kind == "photo":
+        send, extra = bot.send_photo, {}
+    else:
+        send, extra = bot.send_document, {}
+
+    return [
+        (ZABORISTOE, lambda: _send_to(ZABORISTOE, send, FSInputFile(path), caption=caption, reply_markup=keyboard, **extra)),
+        (DOPAMINE, lambda: _send_to(DOPAMINE, send, FSInputFile(path), **extra)),
+    ]
+
+
+async def _send_to(chat_id, send_func, *args, **kwargs):
+    await rate_limiter.wait_if_needed(chat_id)
+    return await safe_send(send_func, chat_id, *args, **kwargs)
+
+
+async def dispatch_post(post: dict):
+    """
+    В обычном режиме публикует сразу. В режиме ingest кладёт пост в очередь,
+    а медиафайл переносит в QUEUE_DIR — его заберёт и удалит publisher.
+    """
+    path = post.get("file")
+    if RUN_MODE != "ingest":
+        try:
+            await publish_post(post)
+        finally:
+            if path and os.path.exists(path):
+                os.remove(path)
+        return
+
+    if path:
+        os.makedirs(QUEUE_DIR, exist_ok=True)
+        queued = os.path.join(QUEUE_DIR, f"{post['chat_id']}_{post['msg_id']}{os.path.splitext(path)[1]}")
+        os.replace(path, queued)
+        post = {**post, "file": queued}
+    if JOB_QUEUE.enqueue(post["chat_id"], post["msg_id"], post):
+        print(f"[Queue] Пост {post['msg_id']} из {post['chat_id']} поставлен в очередь")
+    else:
+        print(f"[Queue] Пост {post['msg_id']} из {post['chat_id']} уже в очереди")
+
+
+# ========== Publisher ==========
+async def publish_job(job: dict, owner: str):
+    """
+    Публикует задачу из очереди, продлевая аренду каждые lease_seconds / 3:
+    safe_send может ждать 429 минутами, а истёкшая аренда — это повторная публикация
+    другим publisher. Перед каждой отправкой аренда проверяется ещё раз.
+    """
+    post = job["payload"]
+
+    async def check_lease():
+        if not JOB_QUEUE.extend(job["id"], owner):
+            raise LeaseLost(f"аренда задачи {job['id']} потеряна")
+
+    publishing = asyncio.create_task(publish_post(
+        post,
+        on_sent=lambda p: JOB_QUEUE.update_payload(job["id"], owner, p),
+        before_send=check_lease,
+    ))
+    while True:
+        done, _ = await asyncio.wait({publishing}, timeout=JOB_QUEUE.lease_seconds / 3)
+        if done:
+            return publishing.result()
+        if not JOB_QUEUE.extend(job["id"], owner):
+            publishing.cancel()
+            raise LeaseLost(f"аренда задачи {job['id']} потеряна")
+
+
+async def publisher_loop(owner: str):
+    """
+    Разбирает очередь: аренда -> публикация -> ack. Упавшие задачи уходят на повтор.
+    Очередь разбирает один publisher (hold_drain), остальные ждут в резерве:
+    лимитер на чат живёт в памяти процесса, а посты должны выходить по порядку.
+    """
+    print(f"[Publisher] ✓ {owner} запущен")
+    purged = JOB_QUEUE.purge_done()
+    if purged:
+        print(f"[Publisher] Удалено {purged} старых выполненных задач")
+    try:
+        await _drain_queue(owner)
+    finally:
+        JOB_QUEUE.release_drain(owner)
+
+
+async def _drain_queue(owner: str):
+    standby = False
+    while True:
+        if not JOB_QUEUE.hold_drain(owner):
+            if not standby:
+                print(f"[Publisher] {owner}: очередь разбирает другой publisher, ждём в резерве")
+                standby = True
+            await asyncio.sleep(PUBLISHER_IDLE_DELAY)
+            continue
+        if standby:
+            print(f"[Publisher] {owner}: забираем очередь")
+            standby = False
+
+        job = JOB_QUEUE.claim(owner)
+        if job is None:
+            await asyncio.sleep(PUBLISHER_IDLE_DELAY)
+            continue
+
+        post = job["payload"]
+        path = post.get("file")
+        if path and not os.path.exists(path):
+            print(f"[Publisher] ❌ Файл {path} пропал, задача {job['id']} снята")
+            JOB_QUEUE.fail(job["id"], owner, "file missing", final=True)
+            continue
+
+        try:
+            await publish_job(job, owner)
+        except LeaseLost as e:
+            print(f"[Publisher] ⚠️ {e}, задачу ведёт другой publisher")
+            continue
+        except Exception as e:
+            state = JOB_QUEUE.fail(job["id"], owner, str(e), retry_in=30 * job["attempts"])
+            if state == "lost":
+                # Аренду уже забрал другой publisher: файл нужен ему, не трогаем
+                print(f"[Publisher] ⚠️ Задача {job['id']} упала ({e}), но её уже ведёт другой publisher")
+                continue
+            print(f"[Publisher ERROR] задача {job['id']} ({job['attempts']} попытка) → {e}, теперь {state}")
+            if state == "failed" and path and os.path.exists(path):
+                # Повторов больше не будет — медиа в QUEUE_DIR никому не нужно
+                os.remove(path)
+            continue
+
+        if JOB_QUEUE.ack(job["id"], owner):
+            print(f"[Publisher] ✓ Задача {job['id']} опубликована")
+            if path and os.path.exists(path):
+                os.remove(path)
+        await asyncio.sleep(1)
+
+
 # ========== Process message ==========
-async def process_message(msg):
+async def process_message(msg, shard=None):
+    """shard — сессия, которая прочитала пост: медиа качается через неё же."""
+    shard = shard or SHARDS[0]
     try:
         chat = await msg.get_chat()
         chat_id, username = get_chat_identifier(chat)
         text = msg.message or ""
 
+        if RUN_MODE == "ingest" and JOB_QUEUE.has_job(chat_id, msg.id):
+            print(f"[Queue] Пост {msg.id} уже в очереди, пропускаем")
+            return
+
         if any(word in text.lower() for word in ignore_words):
             print(f"[IGNORE] Пост {msg.id} пропущен (стоп-слово)")
+            record_stats(chat_id, username, ignored=1)
             return
 
         if len(text) > 100:
             print(f"[IGNORE] Пост {msg.id} пропущен (слишком длинный оригинальный текст)")
+            record_stats(chat_id, username, ignored=1)
             return
 
         if getattr(msg, "web_preview", None):
             print(f"[IGNORE] Пост {msg.id} пропущен (telegram preview)")
+            record_stats(chat_id, username, ignored=1)
             return
 
         link = f"https://t.me/{username}/{msg.id}" if username else ""
@@ -446,38 +1211,30 @@ async def process_message(msg):
         if username:
             caption += f"\n\n🔎 Источник: @{username}\n{link}"
 
+        post = {"chat_id": chat_id, "msg_id": msg.id, "username": username, "caption": caption}
+
         yt_links = extract_youtube_links(text)
         if yt_links:
-            await post_youtube_links_as_text(
-                bot,
-                ZABORISTOE,
-                yt_links,
-                caption=caption,
-                other_chat_ids=[DOPAMINE],
-                reply_markup=InlineKeyboardMarkup(
-                    inline_keyboard=[[InlineKeyboardButton(text="Класс!", callback_data=f"like_post:{msg.id}:{chat_id}")]]
-                ),
-            )
+            await dispatch_post({**post, "kind": "youtube", "links": yt_links})
             return
 
         has_link = "http://" in caption or "https://" in caption
 
         if getattr(msg, "grouped_id", None) is not None:
             print(f"[IGNORE] Пост {msg.id} пропущен (галерея)")
+            record_stats(chat_id, username, ignored=1)
             return
 
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[[InlineKeyboardButton(text="Класс!", callback_data=f"like_post:{msg.id}:{chat_id}")]]
-        )
-
         if msg.media:
             if hasattr(msg, "web_preview") and msg.web_preview:
                 print(f"[IGNORE] Пост {msg.id} пропущен (link preview media)")
+                record_stats(chat_id, username, ignored=1)
                 return
 
             os.makedirs("tmp", exist_ok=True)
             
-            tmp_path = await client.download_media(msg.media, file=os.path.join("tmp", f"{msg.id}"))
+            await shard.acquire()
+            tmp_path = await shard.client.download_media(msg.media, file=os.path.join("tmp", f"{chat_id}_{msg.id}"))
 
             if not tmp_path or not os.path.exists(tmp_path):
                 print(f"[media] ❌ Не удалось скачать медиа из {username}")
@@ -510,7 +1267,8 @@ async def process_message(msg):
             should_check_bayan = is_image or is_gif or is_video
             
             if should_check_bayan:
-                meta = {"chat_id": chat_id, "msg_id": msg.id, "username": username}
+                kind = "video" if is_video else "gif" if is_gif else "photo"
+                meta = {"chat_id": chat_id, "msg_id": msg.id, "username": username, **media_shape(msg.media, kind)}
                 if is_video or is_gif:
                     is_new = await check_and_store_media(file_path=tmp_path, is_video=True, meta=meta)
                 else:
@@ -525,49 +1283,45 @@ async def process_message(msg):
 
             force_file = is_document and not (is_gif or is_video) and has_link
 
-            try:
-                if is_video:
-                    await rate_limiter.wait_if_needed(ZABORISTOE)
-                    await safe_send(bot.send_video, ZABORISTOE, FSInputFile(tmp_path), caption=caption, supports_streaming=True, reply_markup=keyboard)
-                    
-                    await rate_limiter.wait_if_needed(DOPAMINE)
-                    await safe_send(bot.send_video, DOPAMINE, FSInputFile(tmp_path), supports_streaming=True)
-                    
-                elif is_gif:
-                    await rate_limiter.wait_if_needed(ZABORISTOE)
-                    await safe_send(bot.send_animation, ZABORISTOE, FSInputFile(tmp_path), caption=caption, reply_markup=keyboard)
-                    
-                    await rate_limiter.wait_if_needed(DOPAMINE)
-                    await safe_send(bot.send_animation, DOPAMINE, FSInputFile(tmp_path))
-                    
-                elif is_image:
-                    await rate_limiter.wait_if_needed(ZABORISTOE)
-                    await safe_send(bot.send_photo, ZABORISTOE, FSInputFile(tmp_path), caption=caption, reply_markup=keyboard)
-                    
-                    await rate_limiter.wait_if_needed(DOPAMINE)
-                    await safe_send(bot.send_photo, DOPAMINE, FSInputFile(tmp_path))
-                    
-                else:
-                    await rate_limiter.wait_if_needed(ZABORISTOE)
-                    await safe_send(bot.send_document, ZABORISTOE, FSInputFile(tmp_path), caption=caption, reply_markup=keyboard)
-                    
-                    await rate_limiter.wait_if_needed(DOPAMINE)
-                    await safe_send(bot.send_document, DOPAMINE, FSInputFile(tmp_path))
-                    
-            finally:
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
+            kind = "video" if is_video else "gif" if is_gif else "photo" if is_image else "document"
+            await dispatch_post({**post, "kind": kind, "file": tmp_path})
 
         elif text.strip():
-            await rate_limiter.wait_if_needed(ZABORISTOE)
-            await safe_send(bot.send_message, ZABORISTOE, caption, reply_markup=keyboard)
+            await dispatch_post({**post, "kind": "text"})
 
         await asyncio.sleep(3)
 
+    except FloodWaitError:
+        # Пусть check_channel не двигает last_id: пост заберёт другая сессия
+        raise
     except Exception as e:
         print(f"[PROCESS ERROR] {msg.id} → {e}")
         traceback.print_exc()
         
+async def _fetch_liked_post(chat_id: int, message_id: int):
+    """
+    Читает пост и качает его медиа через сессию-владельца канала, в её бюджете запросов.
+    На FloodWait сессия штрафуется, и пост читает следующая по кольцу; если свободных нет,
+    ждём не дольше 10 секунд — админ ждёт ответа на кнопку.
+    """
+    key = next((k for k, entry in DB["monitored"].items() if entry.get("channel_id") == chat_id), str(chat_id))
+    while True:
+        shard = await wait_for_shard(key, timeout=10)
+        if shard is None:
+            break
+        try:
+            await shard.acquire()
+            msg = await shard.client.get_messages(chat_id, ids=message_id)
+            tmp_path = None
+            if msg.media:
+                await shard.acquire()
+                tmp_path = await shard.client.download_media(msg.media, file=os.path.join("tmp", f"like_{msg.id}"))
+            return msg, tmp_path
+        except FloodWaitError as e:
+            shard.penalize(e.seconds)
+    raise RuntimeError("нет свободной userbot-сессии")
+
+
 @dp.callback_query(lambda c: c.data and c.data.startswith("like_post:"))
 async def callback_like_post(query: types.CallbackQuery):
     try:
@@ -579,10 +1333,9 @@ async def callback_like_post(query: types.CallbackQuery):
         message_id = int(parts[1])
         chat_id = int(parts[2])
 
-        msg = await client.get_messages(chat_id, ids=message_id)
+        msg, tmp_path = await _fetch_liked_post(chat_id, message_id)
 
         if msg.media:
-            tmp_path = await client.download_media(msg.media, file=os.path.join("tmp", f"like_{msg.id}"))
 
             is_image = getattr(msg.media, 'photo', None) is not None
             is_document = getattr(msg.media, 'document', None) is not None
@@ -613,14 +1366,28 @@ async def callback_like_post(query: types.CallbackQuery):
         
 # ========== Периодический опрос каналов ==========
 async def poll_monitored_channels():
-    await client.start()
-    print("[Poller] ✓ Цикл мониторинга запущен")
-    
+    """Запускает все userbot-сессии и по циклу опроса на каждую."""
+    for shard in SHARDS:
+        try:
+            await shard.client.start()
+        except Exception as e:
+            print(f"[Shards] ❌ {shard.name} не запустилась: {e}")
+    print(f"[Poller] ✓ Цикл мониторинга запущен, сессий: {len(SHARDS)}")
+
+    await asyncio.gather(*(poll_shard(shard) for shard in SHARDS))
+
+
+async def poll_shard(shard):
+    """Опрос каналов, которые кольцо сейчас отдаёт этой сессии."""
     channel_index = 0
     
     while True:
         try:
-            monitored_keys = get_monitored_keys()
+            if not shard.healthy:
+                await recover_shard(shard)
+                continue
+
+            monitored_keys = [key for key in get_monitored_keys() if SHARD_RING.owner(key) is shard]
             
             if not monitored_keys:
                 await asyncio.sleep(60)
@@ -629,41 +1396,377 @@ async def poll_monitored_channels():
             total_channels = len(monitored_keys)
             
             if total_channels < 60:
-                print(f"[Poller] Режим: проверка всех {total_channels} каналов")
+                print(f"[Poller] {shard.name}: проверка всех {total_channels} каналов")
                 for key in monitored_keys:
-                    await check_channel(key)
+                    if not shard.healthy:
+                        break
+                    await check_channel(key, shard)
                 await asyncio.sleep(60)
             else:
                 if channel_index >= total_channels:
                     channel_index = 0
-                    print(f"[Poller] Карусель: круг завершен, начинаем заново")
+                    print(f"[Poller] {shard.name}: карусель, круг завершен, начинаем заново")
                 
                 key = monitored_keys[channel_index]
-                print(f"[Poller] Карусель [{channel_index + 1}/{total_channels}]: {key}")
-                await check_channel(key)
+                print(f"[Poller] {shard.name}: карусель [{channel_index + 1}/{total_channels}]: {key}")
+                await check_channel(key, shard)
                 
                 channel_index += 1
                 await asyncio.sleep(1)
                 
         except Exception as e:
-            print(f"[Poller ERROR] {e}")
+            print(f"[Poller ERROR] {shard.name} → {e}")
             await asyncio.sleep(5)
 
 
-async def check_channel(key):
-    last_id = DB["monitored"][key].get("last_id", 0)
+async def recover_shard(shard):
+    """Ждёт конца FloodWait или переподключает выпавшую сессию."""
+    wait = shard.blocked_until - shard.clock()
+    if wait > 0:
+        await asyncio.sleep(min(wait, 60))
+        return
+    print(f"[Shards] {shard.name}: нет соединения, переподключаемся")
     try:
-        msgs = await client.get_messages(key, limit=10)
+        await shard.client.connect()
     except Exception as e:
-        print(f"[Poll ERROR] {key} → {e}")
-        return
-    
-    msgs = sorted(msgs, key=lambda m: m.id)
+        print(f"[Shards] ❌ {shard.name}: {e}")
+    await asyncio.sleep(30)
+
+
+CHANNEL_LOCKS = {}
+
+
+async def check_channel(key, shard=None):
+    shard = shard or SHARDS[0]
+    # При переезде канала между сессиями старая и новая не должны читать его одновременно
+    lock = CHANNEL_LOCKS.setdefault(key, asyncio.Lock())
+    async with lock:
+        if key not in DB["monitored"]:
+            return
+        last_id = DB["monitored"][key].get("last_id", 0)
+        try:
+            await shard.acquire()
+            msgs = await shard.client.get_messages(key, limit=10)
+        except FloodWaitError as e:
+            shard.penalize(e.seconds)
+            return
+        except Exception as e:
+            print(f"[Poll ERROR] {key} → {e}")
+            return
+        
+        msgs = sorted(msgs, key=lambda m: m.id)
+        for msg in msgs:
+            if msg.id > last_id:
+                print(f"[Poll] Новый пост {msg.id} из {key}")
+                try:
+                    await process_message(msg, shard)
+                except FloodWaitError as e:
+                    shard.penalize(e.seconds)
+                    return
+                await set_last_id(key, msg.id)
+
+# ========== Бэкфилл истории каналов ==========
+BACKFILL_LOCK = asyncio.Lock()  # одновременно идёт один бэкфилл, чтобы не душить опрос
+BACKFILL_TASKS = {}
+
+
+async def set_backfill_state(channel, state):
+    """Сохраняет прогресс бэкфилла в db.json (None — бэкфилл завершён)."""
+    async with DB_LOCK:
+        backfill = DB.setdefault("backfill", {})
+        if state is None:
+            backfill.pop(channel, None)
+        else:
+            backfill[channel] = state
+        with open(DB_FILE, "w", encoding="utf-8") as f:
+            json.dump(DB, f, ensure_ascii=False, indent=2)
+
+
+def _pick_photo_thumb(photo):
+    """Самый маленький размер фото, который не меньше 320px по длинной стороне."""
+    sizes = [s for s in getattr(photo, "sizes", []) if getattr(s, "w", None) and getattr(s, "h", None)]
+    big_enough = [s for s in sizes if max(s.w, s.h) >= 320]
+    if big_enough:
+        return min(big_enough, key=lambda s: s.w * s.h).type
+    return None
+
+
+async def _backfill_download(shard, media, **kwargs):
+    """Загрузка для бэкфилла: с паузой и в бюджете бэкфилла, чтобы не отнимать запросы у опроса."""
+    await asyncio.sleep(BACKFILL_DOWNLOAD_DELAY)
+    await shard.acquire(backfill=True)
+    return await shard.client.download_media(media, **kwargs)
+
+
+async def _backfill_reader(key, current=None):
+    """
+    (shard, entity) для бэкфилла: сессия-владелец канала по кольцу.
+    После переезда канала на другую сессию entity перечитывается — access_hash у каждой свой.
+    """
+    while True:
+        shard = await wait_for_shard(key)
+        if current is not None and current[0] is shard:
+            return current
+        try:
+            await shard.acquire(backfill=True)
+            return shard, await shard.client.get_entity(key)
+        except FloodWaitError as e:
+            shard.penalize(e.seconds)
+
+
+async def _backfill_fingerprints(shard, msgs, chat_id, username) -> list:
+    """
+    Скачивает превью/мелкие медиа страницы истории и хеширует их.
+    Фото и превью идут одним пакетом, мелкие видео — через кадр, как в живом пути.
+    FloodWaitError пробрасывается: страницу целиком повторит backfill_channel.
+    """
+    images, image_meta, rows = [], [], []
+
     for msg in msgs:
-        if msg.id > last_id:
-            print(f"[Poll] Новый пост {msg.id} из {key}")
-            await process_message(msg)
-            await set_last_id(key, msg.id)
+        if not msg.media:
+            continue
+        photo = getattr(msg.media, "photo", None)
+        document = getattr(msg.media, "document", None)
+        # Размеры — из метаданных оригинала, а не скачанного превью
+        kind = "photo" if photo is not None else "video"
+        meta = {"chat_id": chat_id, "msg_id": msg.id, "username": username, "backfill": True, **media_shape(msg.media, kind)}
+
+        if photo is not None:
+            data = await _backfill_download(shard, msg.media, file=bytes, thumb=_pick_photo_thumb(photo))
+            if data:
+                images.append(data)
+                image_meta.append(meta)
+        elif document is not None and getattr(document, "mime_type", "").startswith("video/"):
+            if getattr(document, "size", 0) <= BACKFILL_MAX_VIDEO_BYTES:
+                os.makedirs("tmp", exist_ok=True)
+                tmp_path = await _backfill_download(shard, msg.media, file=os.path.join("tmp", f"backfill_{msg.id}"))
+                if not tmp_path:
+                    continue
+                try:
+                    fp = await asyncio.to_thread(get_media_fingerprint, file_path=tmp_path, is_video=True, fast=FAST_HASH)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                if fp:
+                    rows.append((fp, meta))
+            elif getattr(document, "thumbs", None):
+                # Крупное видео — только превью, это лучше, чем ничего
+                data = await _backfill_download(shard, msg.media, file=bytes, thumb=-1)
+                if data:
+                    images.append(data)
+                    image_meta.append(meta)
+
+    if images:
+        hashes = await asyncio.to_thread(batch_fingerprints, images, fast=FAST_HASH)
+        rows.extend((h["dhash"], meta) for h, meta in zip(hashes, image_meta) if h)
+    return rows
+
+
+async def backfill_channel(key, limit: int, notify=None):
+    """
+    Проходит историю канала страницами от новых к старым, хеширует медиа
+    и складывает хеши в seen_media, ничего не публикуя.
+    Прогресс (offset_id) пишется в db.json после каждой страницы — можно продолжить после рестарта.
+    У отслеживаемого канала история берётся только до last_id: посты новее ещё прочитает опрос,
+    и их хеши из бэкфилла сделали бы их баянами.
+    """
+    state = DB.get("backfill", {}).get(key)
+    if state is None:
+        last_id = DB["monitored"].get(key, {}).get("last_id", 0)
+        # get_messages отдаёт посты с id < offset_id; 0 — с самого нового
+        state = {"offset_id": last_id + 1 if last_id else 0, "remaining": limit, "stored": 0}
+
+    try:
+        async with BACKFILL_LOCK:
+            reader = await _backfill_reader(key)
+            chat_id, username = get_chat_identifier(reader[1])
+            await set_backfill_state(key, state)
+            print(f"[Backfill] {key}: старт с offset_id={state['offset_id']}, осталось {state['remaining']}")
+
+            while state["remaining"] > 0:
+                shard, entity = reader = await _backfill_reader(key, reader)
+                try:
+                    await shard.acquire(backfill=True)
+                    msgs = await shard.client.get_messages(
+                        entity, limit=min(BACKFILL_PAGE_SIZE, state["remaining"]), offset_id=state["offset_id"]
+                    )
+                    if not msgs:
+                        break
+                    rows = await _backfill_fingerprints(shard, msgs, chat_id, username)
+                except FloodWaitError as e:
+                    # Сессия уходит в штраф, страница повторится целиком на следующей по кольцу:
+                    # offset_id не сдвинут, дубли хешей игнорирует INSERT OR IGNORE
+                    shard.penalize(e.seconds)
+                    continue
+
+                state["stored"] += await store_seen_bulk(rows)
+                state["offset_id"] = min(m.id for m in msgs)
+                state["remaining"] -= len(msgs)
+                await set_backfill_state(key, state)
+                print(f"[Backfill] {key}: до id {state['offset_id']}, сохранено {state['stored']}")
+
+                await asyncio.sleep(BACKFILL_PAGE_DELAY)
+
+        await set_backfill_state(key, None)
+        print(f"[Backfill] ✓ {key}: готово, сохранено {state['stored']} хешей")
+        if notify:
+            await notify(f"✓ Бэкфилл {key} завершён: сохранено {state['stored']} хешей")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"[Backfill ERROR] {key} → {e}")
+        traceback.print_exc()
+        if notify:
+            await notify(f"❌ Бэкфилл {key} прерван: {e}. Повторите /backfill, чтобы продолжить.")
+    finally:
+        BACKFILL_TASKS.pop(key, None)
+
+
+def start_backfill(key, limit: int, notify=None) -> bool:
+    if key in BACKFILL_TASKS:
+        return False
+    BACKFILL_TASKS[key] = asyncio.create_task(backfill_channel(key, limit, notify))
+    return True
+
+
+def resume_backfills():
+    """Продолжает бэкфиллы, прерванные рестартом."""
+    for key, state in list(DB.get("backfill", {}).items()):
+        print(f"[Backfill] Продолжаем {key}")
+        start_backfill(key, state.get("remaining", 0))
+
+# ========== Массовый импорт каналов ==========
+_USERNAME_RE = re.compile(r"^[A-Za-z][A-Za-z0-9_]{3,31}$")
+_TME_RE = re.compile(r"^(?:https?://)?(?:t\.me|telegram\.me)/(?:s/)?([^/?#\s]+)", flags=re.IGNORECASE)
+
+
+def normalize_channel_ref(token: str, bare_names: bool = False):
+    """
+    @name, -100xxxxx или ссылка t.me/name -> ключ для db.json ("@name" / "-100xxxxx").
+    Голое имя без @ принимается только при bare_names (списки из файла).
+    None — строка не похожа на канал вообще, "" — похожа, но такой канал не добавить.
+    """
+    token = token.strip().rstrip(",;")
+    link = _TME_RE.match(token)
+    if link:
+        token = "@" + link.group(1)
+        if token.startswith(("@+", "@joinchat")):
+            return ""  # приватная ссылка-приглашение: без вступления не прочитать
+    if re.fullmatch(r"-100\d+", token):
+        return token
+    if token.startswith("@"):
+        return token if _USERNAME_RE.match(token[1:]) else ""
+    if bare_names and _USERNAME_RE.match(token):
+        return "@" + token
+    return None
+
+
+def parse_channel_refs(text: str, bare_names: bool = False):
+    """Первое слово каждой строки -> (каналы по порядку, строки, которые не разобрать)."""
+    refs, invalid = [], []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        token = line.split()[0]
+        ref = normalize_channel_ref(token, bare_names)
+        if ref:
+            refs.append(ref)
+        elif ref == "":
+            invalid.append((token, "некорректное имя или приватная ссылка"))
+    return refs, invalid
+
+
+async def resolve_channel(key: str):
+    """
+    Проверяет канал сессией, которой он достанется в опросе: get_entity + последний пост.
+    Возвращает запись для db.json (last_id — текущий верхний пост, история не публикуется)
+    или строку с причиной, почему канал не добавить (только если Telegram не знает канал
+    или он закрыт). На FloodWait пробует другой сессией; если свободной сессии нет дольше
+    IMPORT_SESSION_WAIT (FloodWait или нет связи) или запрос упал по сетевой/серверной
+    причине — None: канал не проверен, его можно прислать ещё раз.
+    """
+    entity_ref = int(key) if key.startswith("-100") else key
+    while True:
+        shard = await wait_for_shard(key, timeout=IMPORT_SESSION_WAIT)
+        if shard is None:
+            return None
+        try:
+            await shard.acquire()
+            entity = await shard.client.get_entity(entity_ref)
+            await shard.acquire()
+            top = await shard.client.get_messages(entity, limit=1)
+        except FloodWaitError as e:
+            shard.penalize(e.seconds)
+            continue
+        except (ValueError, UsernameInvalidError, UsernameNotOccupiedError, ChannelPrivateError) as e:
+            return f"{type(e).__name__}: {e}"
+        except Exception as e:
+            print(f"[Import] ⚠️ {key} не проверен: {type(e).__name__}: {e}")
+            return None
+        chat_id, username = get_chat_identifier(entity)
+        last_id = top[0].id if top else 0
+        return {"last_id": last_id, "channel_id": chat_id, "username": username}
+
+
+async def import_channels(refs: list) -> dict:
+    """
+    Массовое добавление каналов: дубли отсекаются до запросов, остальные проверяются
+    параллельно (IMPORT_CONCURRENCY, поверх бюджета сессий), db.json пишется один раз.
+    Возвращает {"added": [...], "duplicate": [...], "invalid": [(канал, причина), ...],
+    "unavailable": [...]} — в unavailable каналы, которые не удалось проверить сейчас.
+    """
+    known = {key.lower() for key in DB["monitored"]}
+    known_ids = {entry.get("channel_id") for entry in DB["monitored"].values() if entry.get("channel_id")}
+    pending, duplicate = [], []
+    for ref in refs:
+        if ref.lower() in known:
+            duplicate.append(ref)
+        else:
+            known.add(ref.lower())
+            pending.append(ref)
+
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+    async def check(ref):
+        async with semaphore:
+            return await resolve_channel(ref)
+
+    print(f"[Import] Проверяем {len(pending)} каналов ({len(duplicate)} дублей отброшено)")
+    results = await asyncio.gather(*(check(ref) for ref in pending))
+
+    entries, invalid, unavailable = {}, [], []
+    for ref, result in zip(pending, results):
+        if result is None:
+            unavailable.append(ref)
+        elif isinstance(result, str):
+            invalid.append((ref, result))
+        elif result["channel_id"] in known_ids:
+            # Тот же канал под другим именем (@name и -100id) или уже в списке
+            duplicate.append(ref)
+        else:
+            known_ids.add(result["channel_id"])
+            entries[ref] = result
+
+    added = await add_monitored_bulk(entries) if entries else []
+    duplicate += [ref for ref in entries if ref not in added]
+    return {"added": added, "duplicate": duplicate, "invalid": invalid, "unavailable": unavailable}
+
+
+def format_import_summary(result: dict, limit: int = 30) -> str:
+    """Отчёт об импорте; длинные списки обрезаются, чтобы влезть в сообщение."""
+    def section(title, items):
+        if not items:
+            return ""
+        lines = [f"• {item}" for item in items[:limit]]
+        if len(items) > limit:
+            lines.append(f"… и ещё {len(items) - limit}")
+        return f"{title} ({len(items)}):\n" + "\n".join(lines) + "\n"
+
+    reply = section("✓ Добавлены", result["added"])
+    reply += section("ℹ️ Уже в списке", result["duplicate"])
+    reply += section("❌ Не добавить", [f"{ref} — {reason}" for ref, reason in result["invalid"]])
+    reply += section("⏸ Не удалось проверить (нет сессии или сбой сети), пришлите ещё раз позже", result.get("unavailable", []))
+    return reply[:4000]
 
 # ========== Aiogram команды ==========
 @dp.message(Command("list"))
@@ -705,6 +1808,33 @@ async def cmd_remove(message: types.Message):
     removed = await remove_monitored(channel)
     await message.reply(f"✓ Канал {channel} удалён." if removed else f"⚠️ Канал {channel} не найден.")
 
+@dp.message(Command("backfill"))
+async def cmd_backfill(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.reply("⛔ Только админы.")
+        return
+    args = message.text.split()[1:]
+    if not args:
+        pending = DB.get("backfill", {})
+        if not pending:
+            await message.reply("Использование: /backfill @channel N\nСейчас бэкфиллов нет.")
+            return
+        lines = [f"• {ch}: осталось {st['remaining']}, сохранено {st['stored']}" for ch, st in pending.items()]
+        await message.reply("⏳ Бэкфиллы:\n" + "\n".join(lines))
+        return
+
+    channel = args[0]
+    try:
+        limit = int(args[1]) if len(args) > 1 else 1000
+    except ValueError:
+        await message.reply("Использование: /backfill @channel N")
+        return
+
+    if start_backfill(channel, limit, notify=message.reply):
+        await message.reply(f"⏳ Бэкфилл {channel}: до {limit} постов, по {BACKFILL_PAGE_SIZE} за страницу.")
+    else:
+        await message.reply(f"⚠️ Бэкфилл {channel} уже идёт.")
+
 @dp.message(Command("stats"))
 async def cmd_stats(message: types.Message):
     if not is_admin(message.from_user.id):
@@ -712,46 +1842,101 @@ async def cmd_stats(message: types.Message):
         return
 
     seen_stats = get_seen_stats()
+    day = seen_stats['window_24h']
 
     msg = (
         f"📊 Статистика:\n"
         f"• Каналов: {len(get_monitored_keys())}\n"
         f"• Уникальных постов: {seen_stats['total']}\n"
         f"• За 24ч: {seen_stats['last_24h']}\n"
-        f"• За 7дн: {seen_stats['last_7d']}"
+        f"• За 7дн: {seen_stats['last_7d']}\n"
+        f"• За 24ч баянов: {day['duplicate']}, игнор: {day['ignored']}, опубликовано: {day['published']}"
     )
+
+    sources = get_channel_stats()
+    if sources:
+        msg += "\n\n🔁 Больше всего баянов:\n" + "\n".join(
+            f"• {('@' + s['username']) if s['username'] else s['chat_id']}: "
+            f"{s['dup_rate']:.0%} ({s['duplicate']} из {s['seen'] + s['duplicate']})"
+            for s in sources
+        )
     await message.reply(msg)
 
 @dp.message()
 async def handle_text(message: types.Message):
     if message.chat.type != "private" or not is_admin(message.from_user.id):
         return
-    lines = [line.strip() for line in message.text.splitlines() if line.strip()]
-    added, skipped = [], []
-    for line in lines:
-        ch = line.split()[0]
-        if ch.startswith("@") or ch.startswith("-100"):
-            added.append(ch) if await add_monitored(ch) else skipped.append(ch)
-    reply = ""
-    if added: reply += "✓ Добавлены:\n" + "\n".join(f"• {c}" for c in added) + "\n"
-    if skipped: reply += "ℹ️ Уже в списке:\n" + "\n".join(f"• {c}" for c in skipped)
-    if not reply: reply = "🤖 Отправьте @channel или -100xxxxx — добавить"
-    await message.reply(reply)
+    if message.document:
+        # Файл со списком каналов: по одному в строке, можно без @
+        buffer = await bot.download(message.document, destination=io.BytesIO())
+        text = buffer.getvalue().decode("utf-8", errors="ignore")
+        refs, invalid = parse_channel_refs(text, bare_names=True)
+    else:
+        refs, invalid = parse_channel_refs(message.text or "")
+    if not refs and not invalid:
+        await message.reply("🤖 Отправьте @channel, -100xxxxx или ссылку t.me (по одному в строке, можно файлом) — добавить")
+        return
+    if len(refs) > IMPORT_CONCURRENCY:
+        await message.reply(f"⏳ Проверяю {len(refs)} каналов...")
+    result = await import_channels(refs)
+    result["invalid"] = invalid + result["invalid"]
+    await message.reply(format_import_summary(result))
 
 # ========== Main ==========
-async def main():
+async def run_split(publishers: int = 1):
+    """Запускает ingest и publisher(ы) отдельными процессами и следит за ними."""
+    script = os.path.abspath(__file__)
+    procs = [await asyncio.create_subprocess_exec(sys.executable, script, "--mode", "ingest")]
+    for _ in range(publishers):
+        procs.append(await asyncio.create_subprocess_exec(sys.executable, script, "--mode", "publisher"))
+    print(f"[Split] ✓ Запущены ingest и {publishers} publisher")
+    try:
+        done, _ = await asyncio.wait([asyncio.create_task(p.wait()) for p in procs], return_when=asyncio.FIRST_COMPLETED)
+        print("[Split] Один из процессов завершился, останавливаем остальные")
+    finally:
+        for p in procs:
+            if p.returncode is None:
+                p.terminate()
+                await p.wait()
+
+
+async def main(publishers: int = 1):
+    global JOB_QUEUE
+    if RUN_MODE == "split":
+        await run_split(publishers)
+        return
+    if RUN_MODE in ("ingest", "publisher"):
+        JOB_QUEUE = JobQueue(JOBS_DB_FILE)
+        print(f"[Queue] Очередь {JOBS_DB_FILE}: {JOB_QUEUE.stats()}")
+    if RUN_MODE == "publisher":
+        await publisher_loop(f"publisher-{os.getpid()}")
+        return
+
+    get_seen_index()
     await client.start()
     print("[Userbot] ✓ Запущен")
+    resume_backfills()
     
-    # Запускаем polling Aiogram бота параллельно с циклом проверки каналов
-    await asyncio.gather(
-        dp.start_polling(bot),
-        poll_monitored_channels()
-    )
+    try:
+        # Запускаем polling Aiogram бота параллельно с циклом проверки каналов
+        await asyncio.gather(
+            dp.start_polling(bot),
+            poll_monitored_channels(),
+            retention_loop(),
+            snapshot_loop()
+        )
+    finally:
+        await save_seen_snapshot()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ZABOR — бот-вороватор контента из Telegram-каналов")
+    parser.add_argument("--mode", choices=["all", "ingest", "publisher", "split"], default=RUN_MODE)
+    parser.add_argument("--publishers", type=int, default=1, help="сколько publisher-процессов в режиме split")
+    args = parser.parse_args()
+    RUN_MODE = args.mode
+
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.publishers))
     except KeyboardInterrupt:
         print("\n[Shutdown] Остановка бота...")
     except Exception as e: